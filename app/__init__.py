@@ -4,12 +4,13 @@ from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from .config import Config
+from .replicas import RoutingSession, add_replica_binds
 
 import sqlite3  # Keep for SQLite check
-from sqlalchemy import event
+from sqlalchemy import event, inspect, literal, select
 from sqlalchemy.engine import Engine
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 bcrypt = Bcrypt()
 login_manager = LoginManager()
 migrate = Migrate()  # Add this line
@@ -28,10 +29,71 @@ def set_sqlite_pragma(dbapi_connection, connection_record):
         except Exception:
             pass
 
+def configure_activity_bind(app):
+    engines = db.engines
+    if engines['activity'].url == engines[None].url:
+        # Same database: share one engine so a request keeps a single
+        # connection and transaction (two SQLite connections would deadlock).
+        engines['activity'] = engines[None]
+    else:
+        if engines['activity'].dialect.name == 'sqlite':
+            # A separate activity database gets its own file, WAL and write lock
+            db.create_all(bind_key='activity')
+        stranded = stranded_activity_tables()
+        if stranded:
+            app.logger.warning(
+                'ACTIVITY_DATABASE_URL is set, but the main database still has rows in %s. '
+                'Run `flask activity migrate` to move them, or existing likes and '
+                'notifications will be missing.', ', '.join(stranded))
+
+def stranded_activity_tables():
+    """Activity tables that still have rows in the main database."""
+    main = db.engines[None]
+    existing = set(inspect(main).get_table_names())
+    stranded = []
+    with main.connect() as conn:
+        for table in db.metadatas['activity'].sorted_tables:
+            if table.name in existing and conn.execute(
+                    select(literal(1)).select_from(table).limit(1)).first():
+                stranded.append(table.name)
+    return stranded
+
+def configure_engine_options(app):
+    # Server databases get the timed pool (app/pool.py). Binds do not inherit
+    # SQLALCHEMY_ENGINE_OPTIONS, so server-database binds get a copy.
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        return
+    from .pool import TIMING_SUPPORTED, TimedQueuePool
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    if TIMING_SUPPORTED:
+        options.setdefault('poolclass', TimedQueuePool)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    binds = app.config['SQLALCHEMY_BINDS']
+    for key, bind in binds.items():
+        if isinstance(bind, str) and not bind.startswith('sqlite'):
+            binds[key] = dict(options, url=bind)
+
+def ensure_notification_partitions(app):
+    from .partitions import ensure_future_partitions
+    try:
+        with app.app_context(), db.engines['activity'].connect() as conn:
+            ensure_future_partitions(conn, app.config['NOTIFICATION_PARTITIONS_AHEAD'])
+            conn.commit()
+    except Exception:
+        # Another worker may be creating the same partition; the DEFAULT
+        # partition still accepts rows, and `flask notifications partitions` can retry.
+        app.logger.exception('Could not create notification partitions')
+
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds.setdefault('activity', app.config.get('ACTIVITY_DATABASE_URL') or app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_BINDS'] = binds
+    add_replica_binds(app)
+    configure_engine_options(app)
+
     db.init_app(app)
     bcrypt.init_app(app)
     login_manager.init_app(app)
@@ -40,6 +102,12 @@ def create_app(config_class=Config):
     # Import models
     from .models import User, Post, Comment, Notification
 
+    # SQLite pragmas first, so no pooled connection misses them
+    from .sqlite_tuning import configure_sqlite
+    with app.app_context():
+        configure_sqlite(app)
+        configure_activity_bind(app)
+
     # Create tables - Remove this as migrations will handle it
     # with app.app_context():
     #     db.create_all()
@@ -48,9 +116,43 @@ def create_app(config_class=Config):
     from .routes import main as main_blueprint
     app.register_blueprint(main_blueprint)
 
-    # User loader callback
+    from .commands import register_commands
+    register_commands(app)
+
+    from . import pool
+    pool.init_app(app)
+
+    from . import instrumentation
+    instrumentation.init_app(app)
+
+    from . import readonly
+    readonly.init_app(app)
+
+    from . import replicas
+    replicas.init_app(app)
+
+    from . import user_cache
+    user_cache.init_app(app)
+
+    from . import passwords
+    passwords.init_app(app)
+
+    from . import ratelimit
+    ratelimit.init_app(app)
+
+    from . import username_filter
+    username_filter.init_app(app)
+
+    from . import purge
+    purge.init_app(app)
+
+    # Keep future monthly notification partitions ahead of the clock
+    if app.config['NOTIFICATION_PARTITIONING']:
+        ensure_notification_partitions(app)
+
+    # User loader callback, served from a short-lived cache (app/user_cache.py)
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return user_cache.load_user(int(user_id))
 
     return app
\ No newline at end of file
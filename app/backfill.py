@@ -0,0 +1,220 @@
+"""Online, resumable batched backfills for schema changes.
+
+A schema change that needs existing rows filled in is done in three steps,
+none of which takes the site down:
+1. expand: a migration adds the column as nullable (cheap) and queues the
+   job by inserting a 'pending' backfill_state row itself (op.bulk_insert;
+   see e8a35c1f6b20), so it keeps working if the job is later renamed;
+2. backfill: `flask backfill run` fills it in while the site is serving;
+3. contract: a later migration that relies on the data (NOT NULL, a unique
+   index) first calls require_done(op.get_bind(), 'job_name').
+
+A job walks its table in primary-key order. Each batch is one short
+transaction that also records the job's progress (last_id) in the
+backfill_state table, so a job that is stopped or crashes resumes after the
+last committed batch.
+
+Throttling, measured per batch:
+- duty cycle: after a batch that took t seconds the runner sleeps
+  t * (1 - duty) / duty, so at BACKFILL_DUTY_CYCLE=0.5 it keeps the database
+  busy at most half the time and backs off by itself when the database slows;
+- the batch size adapts to keep each batch near BACKFILL_TARGET_BATCH_MS,
+  which bounds how long its row locks are held;
+- a time budget stops the run between batches and leaves the job 'paused'.
+
+Jobs are registered with @backfill_job at the end of this module.
+"""
+import time
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from .content import derive_post_metadata
+from .models import BackfillState, Post, User
+
+MIN_BATCH_SIZE = 10
+
+JOBS = {}
+
+state = BackfillState.__table__
+
+
+class BackfillJob:
+    def __init__(self, name, table, columns, process, where=None, description=''):
+        self.name = name
+        self.table = table
+        self.columns = list(columns)
+        self.process = process  # rows -> list of {'id': ..., column: new value}
+        self.where = where  # table -> criterion for rows that need work
+        self.description = description
+
+    def select_batch(self, last_id, limit):
+        pk = self.table.c.id
+        stmt = sa.select(pk, *[self.table.c[name] for name in self.columns]).where(pk > last_id)
+        if self.where is not None:
+            stmt = stmt.where(self.where(self.table))
+        return stmt.order_by(pk).limit(limit)
+
+    def remaining(self, conn, last_id):
+        stmt = sa.select(sa.func.count()).select_from(self.table).where(self.table.c.id > last_id)
+        if self.where is not None:
+            stmt = stmt.where(self.where(self.table))
+        return conn.execute(stmt).scalar()
+
+    def write(self, conn, changes):
+        if not changes:
+            return
+        # Bind names must differ from the column names in SET
+        names = sorted(set(changes[0]) - {'id'})
+        stmt = (self.table.update()
+                .where(self.table.c.id == sa.bindparam('b_id'))
+                .values({name: sa.bindparam('b_' + name) for name in names}))
+        conn.execute(stmt, [{'b_' + key: value for key, value in change.items()} for change in changes])
+
+
+def backfill_job(name, table, columns, where=None):
+    """Register process(rows) as the backfill job `name` over `table`."""
+    def decorator(process):
+        JOBS[name] = BackfillJob(name, table, columns, process, where, (process.__doc__ or '').strip())
+        return process
+    return decorator
+
+
+def get_job(name):
+    try:
+        return JOBS[name]
+    except KeyError:
+        raise KeyError('Unknown backfill job %r (known: %s)' % (name, ', '.join(sorted(JOBS)))) from None
+
+
+def get_state(conn, name):
+    return conn.execute(sa.select(state).where(state.c.name == name)).first()
+
+
+def enqueue(conn, name):
+    """Queue a job to run from the start."""
+    get_job(name)
+    values = dict(status='pending', last_id=0, rows_scanned=0, rows_changed=0,
+                  error=None, updated_at=datetime.utcnow(), finished_at=None)
+    if get_state(conn, name) is None:
+        conn.execute(state.insert().values(name=name, created_at=datetime.utcnow(), **values))
+    else:
+        conn.execute(state.update().where(state.c.name == name).values(**values))
+
+
+def require_done(conn, name):
+    """Fail a contract migration whose backfill has not finished.
+
+    A job with nothing left to do (a new or small database) is marked done.
+    Only the state row is checked for a job that is no longer registered, so
+    old migrations survive jobs being renamed or removed.
+    """
+    row = get_state(conn, name)
+    if row is not None and row.status == 'done':
+        return
+    if name not in JOBS:
+        if row is not None:
+            raise RuntimeError('Backfill %r has not finished (status %s).' % (name, row.status))
+        return
+    last_id = row.last_id if row is not None else 0
+    left = get_job(name).remaining(conn, last_id)
+    if left:
+        raise RuntimeError('Backfill %r has %d row(s) left; run `flask backfill run %s` '
+                           'before this migration.' % (name, left, name))
+    if row is None:
+        enqueue(conn, name)
+    conn.execute(state.update().where(state.c.name == name).values(
+        status='done', finished_at=datetime.utcnow()))
+
+
+def pending_jobs(conn):
+    """Names of queued jobs that have not finished, oldest first."""
+    return conn.execute(
+        sa.select(state.c.name).where(state.c.status != 'done').order_by(state.c.created_at)
+    ).scalars().all()
+
+
+def next_batch_size(size, elapsed_ms, target_ms, maximum):
+    if elapsed_ms > target_ms:
+        return max(MIN_BATCH_SIZE, size // 2)
+    if elapsed_ms < target_ms / 2:
+        return min(maximum, size + size // 2)
+    return size
+
+
+def run_job(engine, name, batch_size, max_batch_size, target_batch_ms, duty_cycle,
+            time_budget=None, restart=False, report=None):
+    """Run a job until it is done or the time budget (seconds) is spent.
+
+    Returns the job's status: 'done' or 'paused'. report(name, last_id, rows,
+    changed, batch_size, elapsed_ms) is called after every batch.
+    """
+    job = get_job(name)
+    started = time.monotonic()
+    with engine.begin() as conn:
+        row = get_state(conn, name)
+        if row is None or restart:
+            enqueue(conn, name)
+        elif row.status == 'done':
+            return 'done'
+        conn.execute(state.update().where(state.c.name == name).values(status='running', error=None))
+
+    while True:
+        if time_budget is not None and time.monotonic() - started >= time_budget:
+            with engine.begin() as conn:
+                conn.execute(state.update().where(state.c.name == name).values(status='paused'))
+            return 'paused'
+
+        batch_started = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                # Progress is read and written in the batch's transaction, so
+                # a second runner (on PostgreSQL) waits instead of redoing it
+                last_id = conn.execute(
+                    sa.select(state.c.last_id).where(state.c.name == name).with_for_update()
+                ).scalar()
+                rows = conn.execute(job.select_batch(last_id, batch_size)).fetchall()
+                if not rows:
+                    conn.execute(state.update().where(state.c.name == name).values(
+                        status='done', updated_at=datetime.utcnow(), finished_at=datetime.utcnow()))
+                    return 'done'
+                changes = job.process(rows)
+                job.write(conn, changes)
+                last_id = rows[-1].id
+                conn.execute(state.update().where(state.c.name == name).values(
+                    last_id=last_id,
+                    rows_scanned=state.c.rows_scanned + len(rows),
+                    rows_changed=state.c.rows_changed + len(changes),
+                    updated_at=datetime.utcnow(),
+                ))
+        except Exception as exc:
+            with engine.begin() as conn:
+                conn.execute(state.update().where(state.c.name == name).values(
+                    status='failed', error=repr(exc), updated_at=datetime.utcnow()))
+            raise
+        except BaseException:
+            # Ctrl-C or shutdown: the batch rolled back, so resume from last_id
+            with engine.begin() as conn:
+                conn.execute(state.update().where(state.c.name == name).values(
+                    status='paused', updated_at=datetime.utcnow()))
+            raise
+
+        elapsed = time.perf_counter() - batch_started
+        if report is not None:
+            report(name, last_id, len(rows), len(changes), batch_size, elapsed * 1000.0)
+        batch_size = next_batch_size(batch_size, elapsed * 1000.0, target_batch_ms, max_batch_size)
+        if duty_cycle < 1:
+            time.sleep(elapsed * (1 - duty_cycle) / duty_cycle)
+
+
+@backfill_job('post_derived', Post.__table__, ['content'], where=lambda post: post.c.content_hash.is_(None))
+def derive_posts(rows):
+    """Derived post metadata: excerpt, word/char counts, reading time, content hash."""
+    return [dict(derive_post_metadata(row.content), id=row.id) for row in rows]
+
+
+@backfill_job('username_lower', User.__table__, ['username', 'username_lower'])
+def lowercase_usernames(rows):
+    """user.username_lower, lowercased in Python as User.by_username() does."""
+    return [{'id': row.id, 'username_lower': row.username.lower()}
+            for row in rows if row.username_lower != row.username.lower()]
@@ -0,0 +1,254 @@
+import time
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import select
+
+from . import db
+from . import partitions
+
+notifications_cli = AppGroup('notifications', help='Notification table maintenance.')
+posts_cli = AppGroup('posts', help='Post maintenance.')
+sqlite_cli = AppGroup('sqlite', help='SQLite maintenance.')
+users_cli = AppGroup('users', help='User account administration.')
+purge_cli = AppGroup('purge', help='Remove soft-deleted posts and users.')
+activity_cli = AppGroup('activity', help='Separate activity database (likes, notifications).')
+backfill_cli = AppGroup('backfill', help='Online batched backfills for schema changes.')
+
+
+@notifications_cli.command('partitions')
+@click.option('--months-ahead', type=int, default=None, help='Months of future partitions to create.')
+def create_partitions_command(months_ahead):
+    """Create upcoming monthly notification partitions (PostgreSQL)."""
+    from flask import current_app
+    if months_ahead is None:
+        months_ahead = current_app.config['NOTIFICATION_PARTITIONS_AHEAD']
+    with db.engines['activity'].connect() as conn:
+        if not partitions.is_partitioned(conn):
+            click.echo('notification table is not partitioned; nothing to do.')
+            return
+        created = partitions.ensure_future_partitions(conn, months_ahead)
+        conn.commit()
+    click.echo('Created %d partition(s): %s' % (len(created), ', '.join(created) or '-'))
+
+
+@notifications_cli.command('prune')
+@click.option('--keep-months', type=click.IntRange(min=0), default=None,
+              help='Months of notifications to keep (0 keeps everything).')
+def prune_command(keep_months):
+    """Drop notifications older than the retention window."""
+    from flask import current_app
+    if keep_months is None:
+        keep_months = current_app.config['NOTIFICATION_RETENTION_MONTHS']
+        if not keep_months:
+            raise click.UsageError('Set NOTIFICATION_RETENTION_MONTHS or pass --keep-months.')
+    if keep_months == 0:
+        click.echo('Keeping every notification; nothing to prune.')
+        return
+    with db.engines['activity'].connect() as conn:
+        dropped, deleted = partitions.drop_expired(conn, keep_months)
+        conn.commit()
+    if dropped:
+        click.echo('Dropped %d partition(s): %s' % (len(dropped), ', '.join(dropped)))
+    click.echo('Deleted %d notification(s).' % deleted)
+
+
+@posts_cli.command('derive')
+@click.option('--batch-size', type=int, default=None, help='Rows in the first batch.')
+@click.option('--time-budget', type=float, default=None, help='Stop (resumably) after this many seconds.')
+@click.option('--restart', is_flag=True, help='Start over from the first post.')
+@click.pass_context
+def derive_command(ctx, batch_size, time_budget, restart):
+    """Backfill derived post metadata; same as `flask backfill run post_derived`."""
+    ctx.invoke(backfill_run_command, names=('post_derived',), batch_size=batch_size,
+               time_budget=time_budget, restart=restart)
+
+
+@sqlite_cli.command('maintain')
+def sqlite_maintain_command():
+    """Checkpoint and truncate the WAL, then run PRAGMA optimize."""
+    from .sqlite_tuning import maintain, sqlite_engines
+    engines = sqlite_engines()
+    if not engines:
+        click.echo('No SQLite databases configured; nothing to do.')
+        return
+    for engine in engines:
+        busy, log_frames, checkpointed = maintain(engine, checkpoint='TRUNCATE')
+        click.echo('%s: checkpointed %d of %d WAL frame(s)%s' % (
+            engine.url.database, checkpointed, log_frames, ' (busy)' if busy else ''))
+
+
+@sqlite_cli.command('pragmas')
+def sqlite_pragmas_command():
+    """Show the effective tuning pragmas of each SQLite database."""
+    from flask import current_app
+    from .sqlite_tuning import sqlite_engines
+    for engine in sqlite_engines():
+        with engine.connect() as conn:
+            cursor = conn.connection.dbapi_connection.cursor()
+            values = ['%s=%s' % (name, cursor.execute('PRAGMA %s' % name).fetchone()[0])
+                      for name in current_app.config['SQLITE_PRAGMAS']]
+            cursor.close()
+        click.echo('%s: %s' % (engine.url.database, ', '.join(values)))
+
+
+@users_cli.command('delete')
+@click.argument('username')
+def delete_user_command(username):
+    """Soft-delete an account; its content disappears now and is purged later."""
+    from .models import User
+    user = User.by_username(username).first()
+    if user is None:
+        raise click.ClickException('No active user named %r.' % username)
+    user.soft_delete()
+    db.session.commit()
+    click.echo('Deleted %s (id %d); run `flask purge run` or wait for the background purge.' % (
+        user.username, user.id))
+
+
+@purge_cli.command('run')
+@click.option('--batch-size', type=int, default=None, help='Rows per delete transaction.')
+@click.option('--pause', type=float, default=None, help='Seconds to sleep between transactions.')
+def purge_run_command(batch_size, pause):
+    """Purge soft-deleted posts and users in small chunks."""
+    from flask import current_app
+    from .purge import purge_deleted
+    deleted = purge_deleted(
+        batch_size or current_app.config['PURGE_BATCH_SIZE'],
+        current_app.config['PURGE_PAUSE'] if pause is None else pause,
+    )
+    click.echo('Deleted %s' % (', '.join('%d %s row(s)' % (n, table) for table, n in sorted(deleted.items()))
+                               or 'nothing'))
+
+
+@purge_cli.command('status')
+def purge_status_command():
+    """Show how many posts and users are waiting to be purged."""
+    from .models import Post, User
+    from .purge import pending
+    click.echo('%d post(s) and %d user(s) pending.' % (len(pending(Post.__table__)), len(pending(User.__table__))))
+
+
+@backfill_cli.command('status')
+def backfill_status_command():
+    """Show every backfill job and its progress."""
+    from .backfill import JOBS, get_state
+    with db.engine.connect() as conn:
+        for name, job in sorted(JOBS.items()):
+            row = get_state(conn, name)
+            if row is None:
+                click.echo('%-16s not queued    %s' % (name, job.description))
+                continue
+            click.echo('%-16s %-12s last id %d, %d scanned, %d changed%s' % (
+                name, row.status, row.last_id, row.rows_scanned, row.rows_changed,
+                ' (%s)' % row.error if row.error else ''))
+
+
+@backfill_cli.command('run')
+@click.argument('names', nargs=-1)
+@click.option('--batch-size', type=int, default=None, help='Rows in the first batch.')
+@click.option('--duty-cycle', type=float, default=None, help='Share of time spent working (0-1].')
+@click.option('--target-ms', type=int, default=None, help='Batch duration to aim for.')
+@click.option('--time-budget', type=float, default=None, help='Stop (resumably) after this many seconds.')
+@click.option('--restart', is_flag=True, help='Start over from the first row.')
+def backfill_run_command(names, batch_size, duty_cycle, target_ms, time_budget, restart):
+    """Run the named jobs, or every queued job that has not finished."""
+    from flask import current_app
+    from .backfill import get_job, pending_jobs, run_job
+    config = current_app.config
+    duty_cycle = config['BACKFILL_DUTY_CYCLE'] if duty_cycle is None else duty_cycle
+    if not 0 < duty_cycle <= 1:
+        raise click.UsageError('--duty-cycle must be in (0, 1].')
+    try:
+        for name in names:
+            get_job(name)
+    except KeyError as exc:
+        raise click.UsageError(exc.args[0])
+    if not names:
+        with db.engine.connect() as conn:
+            names = pending_jobs(conn)
+        if not names:
+            click.echo('No backfills queued.')
+            return
+
+    def report(name, last_id, rows, changed, size, elapsed_ms):
+        click.echo('%s: %d row(s) up to id %d, %d changed (%.0f ms)' % (name, rows, last_id, changed, elapsed_ms))
+
+    started = time.monotonic()
+    for name in names:
+        budget = None if time_budget is None else max(0.0, time_budget - (time.monotonic() - started))
+        status = run_job(
+            db.engine, name,
+            batch_size=batch_size or config['BACKFILL_BATCH_SIZE'],
+            max_batch_size=max(batch_size or 0, config['BACKFILL_MAX_BATCH_SIZE']),
+            target_batch_ms=target_ms or config['BACKFILL_TARGET_BATCH_MS'],
+            duty_cycle=duty_cycle, time_budget=budget, restart=restart, report=report,
+        )
+        click.echo('%s: %s' % (name, status))
+
+
+@activity_cli.command('migrate')
+@click.option('--batch-size', type=int, default=1000, show_default=True)
+@click.option('--keep-source', is_flag=True, help='Leave the copied rows in the main database.')
+def activity_migrate_command(batch_size, keep_source):
+    """Move likes and notifications from the main database to ACTIVITY_DATABASE_URL."""
+    from sqlalchemy import delete, inspect
+    from sqlalchemy.exc import IntegrityError
+    source, target = db.engines[None], db.engines['activity']
+    if source is target:
+        raise click.UsageError('ACTIVITY_DATABASE_URL is not set; activity already lives in the main database.')
+    existing = set(inspect(source).get_table_names())
+    for table in db.metadatas['activity'].sorted_tables:
+        if table.name not in existing:
+            continue
+        copied = skipped = 0
+        last_id = 0
+        while True:
+            with source.connect() as conn:
+                rows = conn.execute(
+                    select(table).where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+                ).mappings().all()
+            if not rows:
+                break
+            # Re-runs skip rows already copied (same id)
+            with target.connect() as conn:
+                present = set(conn.execute(
+                    select(table.c.id).where(table.c.id.in_([row['id'] for row in rows]))).scalars())
+            batch = [dict(row) for row in rows if row['id'] not in present]
+            try:
+                with target.begin() as conn:
+                    if batch:
+                        conn.execute(table.insert(), batch)
+                copied += len(batch)
+            except IntegrityError:
+                # A duplicate made since the switch (e.g. the same like again): keep the newer row
+                for row in batch:
+                    try:
+                        with target.begin() as conn:
+                            conn.execute(table.insert(), [row])
+                        copied += 1
+                    except IntegrityError:
+                        skipped += 1
+            skipped += len(rows) - len(batch)
+            last_id = rows[-1]['id']
+        click.echo('%s: copied %d row(s), skipped %d already present' % (table.name, copied, skipped))
+
+        if not keep_source and last_id:
+            while True:
+                with source.begin() as conn:
+                    ids = conn.execute(select(table.c.id).where(table.c.id <= last_id)
+                                       .order_by(table.c.id).limit(batch_size)).scalars().all()
+                    if not ids:
+                        break
+                    conn.execute(delete(table).where(table.c.id.in_(ids)))
+            click.echo('%s: removed copied rows from the main database' % table.name)
+
+
+def register_commands(app):
+    app.cli.add_command(notifications_cli)
+    app.cli.add_command(posts_cli)
+    app.cli.add_command(sqlite_cli)
+    app.cli.add_command(users_cli)
+    app.cli.add_command(purge_cli)
+    app.cli.add_command(backfill_cli)
+    app.cli.add_command(activity_cli)
@@ -1,5 +1,22 @@
 import os
 
+
+def engine_options_from_env(environ):
+    """SQLAlchemy engine options for a server database, read from environ."""
+    return {
+        'pool_size': int(environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+        'connect_args': {
+            'application_name': environ.get('DB_APPLICATION_NAME', 'tikblog'),
+            # Milliseconds; 0 lets statements run as long as they like
+            'options': '-c statement_timeout=%d' % int(environ.get('DB_STATEMENT_TIMEOUT_MS', 30000)),
+        },
+    }
+
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key')
     
@@ -12,3 +29,107 @@ class Config:
     
     SQLALCHEMY_DATABASE_URI = database_url or 'sqlite:///site.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Connection pool and per-connection settings for server databases (see
+    # app/pool.py). Each worker has its own pool: keep WEB_CONCURRENCY x
+    # (DB_POOL_SIZE + DB_MAX_OVERFLOW) below the server's max_connections.
+    if not SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        SQLALCHEMY_ENGINE_OPTIONS = engine_options_from_env(os.environ)
+    DB_POOL_SLOW_CHECKOUT_MS = int(os.environ.get('DB_POOL_SLOW_CHECKOUT_MS', 100))
+
+    # High-churn activity tables (notifications, likes) use the 'activity' bind.
+    # Unset, they share the main database; point this at e.g.
+    # sqlite:///activity.db to give them their own SQLite file and WAL.
+    ACTIVITY_DATABASE_URL = os.environ.get('ACTIVITY_DATABASE_URL', '')
+
+    # SQLite tuning profile, applied to every new SQLite connection (see
+    # app/sqlite_tuning.py). An empty value leaves SQLite's default.
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'mmap_size': os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)),
+        'cache_size': os.environ.get('SQLITE_CACHE_SIZE', '-65536'),  # negative: KiB
+        'busy_timeout': os.environ.get('SQLITE_BUSY_TIMEOUT', '5000'),  # ms
+        'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+    }
+    # Seconds between background WAL checkpoints + PRAGMA optimize (0 disables)
+    SQLITE_MAINTENANCE_INTERVAL = int(os.environ.get('SQLITE_MAINTENANCE_INTERVAL', 600))
+
+    # Soft delete (see app/purge.py): seconds between background purges of
+    # deleted posts and users (0 disables), rows per delete transaction, and
+    # the pause in seconds between transactions.
+    PURGE_INTERVAL = int(os.environ.get('PURGE_INTERVAL', 300))
+    PURGE_BATCH_SIZE = int(os.environ.get('PURGE_BATCH_SIZE', 500))
+    PURGE_PAUSE = float(os.environ.get('PURGE_PAUSE', 0.2))
+
+    # Batched backfills (see app/backfill.py): starting and largest batch
+    # size, the batch duration to aim for, and the share of time spent
+    # working rather than sleeping between batches.
+    BACKFILL_BATCH_SIZE = int(os.environ.get('BACKFILL_BATCH_SIZE', 500))
+    BACKFILL_MAX_BATCH_SIZE = int(os.environ.get('BACKFILL_MAX_BATCH_SIZE', 5000))
+    BACKFILL_TARGET_BATCH_MS = int(os.environ.get('BACKFILL_TARGET_BATCH_MS', 200))
+    BACKFILL_DUTY_CYCLE = float(os.environ.get('BACKFILL_DUTY_CYCLE', 0.5))
+
+    # Notifications: optional monthly range partitioning (PostgreSQL only) and
+    # retention in months (0 keeps everything).
+    NOTIFICATION_PARTITIONING = os.environ.get('NOTIFICATION_PARTITIONING', '').lower() in ('1', 'true', 'yes')
+    NOTIFICATION_PARTITIONS_AHEAD = int(os.environ.get('NOTIFICATION_PARTITIONS_AHEAD', 3))
+    NOTIFICATION_RETENTION_MONTHS = int(os.environ.get('NOTIFICATION_RETENTION_MONTHS', 0))
+
+    # Per-route SQL query budgets (see app/instrumentation.py). Over-budget
+    # requests log a warning, or fail when QUERY_BUDGET_STRICT is set.
+    QUERY_BUDGETS = {}
+    QUERY_BUDGET_DEFAULT = None
+    QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT', '').lower() in ('1', 'true', 'yes')
+
+    # Development/staging SQL instrumentation: per-request timing, repeated
+    # statement fingerprints and N+1 detection, reported in an X-SQL-Queries
+    # header and (with SQL_PANEL) an HTML panel at the bottom of each page.
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', '').lower() in ('1', 'true', 'yes')
+    SQL_PANEL = os.environ.get('SQL_PANEL', '').lower() in ('1', 'true', 'yes')
+    NPLUSONE_THRESHOLD = int(os.environ.get('NPLUSONE_THRESHOLD', 3))
+
+    # Password hashing (see app/passwords.py). BCRYPT_TARGET_MS, if set,
+    # picks the cost that takes about that long on this host at startup
+    # (never below BCRYPT_MIN_LOG_ROUNDS); otherwise BCRYPT_LOG_ROUNDS is used.
+    # At most BCRYPT_MAX_CONCURRENCY hashes run at once. A hash still blocks
+    # its request thread, so use threaded or gevent workers.
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    BCRYPT_TARGET_MS = int(os.environ.get('BCRYPT_TARGET_MS', 0))
+    BCRYPT_MIN_LOG_ROUNDS = int(os.environ.get('BCRYPT_MIN_LOG_ROUNDS', 10))
+    BCRYPT_MAX_CONCURRENCY = int(os.environ.get('BCRYPT_MAX_CONCURRENCY', os.cpu_count() or 2))
+    BCRYPT_QUEUE_TIMEOUT = float(os.environ.get('BCRYPT_QUEUE_TIMEOUT', 10))
+
+    # Token-bucket rate limits on login, register and write endpoints (see
+    # app/ratelimit.py). Buckets are per process unless RATELIMIT_STORAGE_URL
+    # points at Redis. Set RATELIMIT_TRUSTED_PROXIES to the number of proxies
+    # in front of the app so the client IP is read from X-Forwarded-For.
+    # Behind a proxy (assumed on Heroku) without it, per-IP limits are off.
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL', '')
+    RATELIMIT_TRUSTED_PROXIES = int(os.environ.get('RATELIMIT_TRUSTED_PROXIES', 0))
+    RATELIMIT_BEHIND_PROXY = os.environ.get(
+        'RATELIMIT_BEHIND_PROXY', 'true' if os.environ.get('DYNO') else '').lower() in ('1', 'true', 'yes')
+    RATELIMITS = {}
+
+    # In-memory Bloom filter of taken usernames behind /api/username-available
+    # (see app/username_filter.py), rebuilt every USERNAME_FILTER_REFRESH seconds
+    USERNAME_FILTER_ENABLED = os.environ.get('USERNAME_FILTER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    USERNAME_FILTER_ERROR_RATE = float(os.environ.get('USERNAME_FILTER_ERROR_RATE', 0.01))
+    USERNAME_FILTER_REFRESH = int(os.environ.get('USERNAME_FILTER_REFRESH', 600))
+
+    # Seconds Flask-Login's user loader may serve current_user from an
+    # in-process cache instead of querying (0 disables; see app/user_cache.py)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 30))
+
+    # Run GET/HEAD requests in a read-only session and transaction (see app/readonly.py)
+    READ_ONLY_SAFE_REQUESTS = os.environ.get('READ_ONLY_SAFE_REQUESTS', 'true').lower() in ('1', 'true', 'yes')
+
+    # Optional read replicas (comma-separated URLs) for read-only requests; see
+    # app/replicas.py. After a write, a visitor reads from the primary for
+    # REPLICA_READ_YOUR_WRITES seconds.
+    DATABASE_REPLICA_URLS = [url.strip().replace('postgres://', 'postgresql://', 1)
+                             for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    REPLICA_READ_YOUR_WRITES = int(os.environ.get('REPLICA_READ_YOUR_WRITES', 10))
+    REPLICA_HEALTH_INTERVAL = int(os.environ.get('REPLICA_HEALTH_INTERVAL', 5))
+    REPLICA_RETRY_SECONDS = int(os.environ.get('REPLICA_RETRY_SECONDS', 30))
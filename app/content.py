@@ -0,0 +1,167 @@
+"""Values derived from a post's content when it is saved.
+
+derive_post_metadata() is the single place that parses a story body. It runs
+once per new_post/edit_post (through Post.set_content) and in the batched
+post_derived backfill (app/backfill.py); templates and ranking read the
+stored columns.
+
+render_content_html() turns a story into sanitized HTML. The result is stored
+with RENDERER_VERSION; bump the version whenever the renderer's output changes
+and posts are re-rendered lazily the next time they are shown.
+"""
+import hashlib
+import math
+import re
+from html import escape
+from html.parser import HTMLParser
+
+from markupsafe import Markup
+
+EXCERPT_LENGTH = 300
+WORDS_PER_MINUTE = 200
+
+
+def plain_text(content):
+    """Story text with tags stripped and whitespace collapsed."""
+    return Markup(content or '').striptags()
+
+
+def make_excerpt(content, length=EXCERPT_LENGTH, text=None):
+    """Plain-text preview of a story, cut at a word boundary."""
+    if text is None:
+        text = plain_text(content)
+    if len(text) <= length:
+        return text
+    cut = text[:length - 1]
+    if ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut + '…'
+
+
+def derive_post_metadata(content):
+    """Return the stored Post columns that depend only on the content."""
+    text = plain_text(content)
+    word_count = len(text.split())
+    return {
+        'excerpt': make_excerpt(content, text=text),
+        'word_count': word_count,
+        'char_count': len(text),
+        'reading_time': max(1, math.ceil(word_count / WORDS_PER_MINUTE)),
+        'content_hash': hashlib.sha256((content or '').encode('utf-8')).hexdigest(),
+    }
+
+
+RENDERER_VERSION = 3
+
+ALLOWED_TAGS = {
+    'a', 'b', 'blockquote', 'br', 'code', 'em', 'h2', 'h3', 'h4', 'hr', 'i',
+    'li', 'ol', 'p', 'pre', 's', 'strong', 'u', 'ul',
+}
+VOID_TAGS = {'br', 'hr'}
+# Raw-text elements: dropped together with everything up to their end tag.
+# Any other tag outside the allowlist is dropped but its text is kept.
+RAW_TEXT_TAGS = {'script', 'style'}
+SAFE_URL_PREFIXES = ('http://', 'https://', 'mailto:')
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+LOOKS_LIKE_MARKUP = re.compile(r'<[a-zA-Z!/?]')
+
+
+class _Sanitizer(HTMLParser):
+    """Rebuilds markup from an allowlist: known tags without attributes
+    (except a safe href on links), escaped text, everything else dropped."""
+
+    # Parse script and style bodies as markup like any other element. They
+    # are dropped either way, and this way an unclosed one can be recovered
+    # from the callbacks alone (see result()).
+    CDATA_CONTENT_ELEMENTS = ()
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.open_tags = []
+        self.skip_depth = 0
+        self.skipped = []  # (handler, args) seen inside the dropped element
+
+    def handle_starttag(self, tag, attrs):
+        if self.skip_depth:
+            self.skipped.append((self.handle_starttag, (tag, attrs)))
+            if tag in RAW_TEXT_TAGS:
+                self.skip_depth += 1
+            return
+        if tag in RAW_TEXT_TAGS:
+            self.skip_depth = 1
+            return
+        if tag not in ALLOWED_TAGS:
+            return
+        if tag in VOID_TAGS:
+            self.out.append('<%s>' % tag)
+            return
+        if tag == 'a':
+            href = (dict(attrs).get('href') or '').strip()
+            if href.lower().startswith(SAFE_URL_PREFIXES):
+                self.out.append('<a href="%s" rel="nofollow noopener">' % escape(href, quote=True))
+            else:
+                self.out.append('<a>')
+        else:
+            self.out.append('<%s>' % tag)
+        self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if self.skip_depth:
+            self.skipped.append((self.handle_startendtag, (tag, attrs)))
+        elif tag in VOID_TAGS:
+            self.out.append('<%s>' % tag)
+
+    def handle_endtag(self, tag):
+        if self.skip_depth:
+            if tag in RAW_TEXT_TAGS:
+                self.skip_depth -= 1
+            if self.skip_depth:
+                self.skipped.append((self.handle_endtag, (tag,)))
+            else:
+                self.skipped = []
+            return
+        if tag not in self.open_tags:
+            return
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.out.append('</%s>' % open_tag)
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self.skip_depth:
+            self.skipped.append((self.handle_data, (data,)))
+        else:
+            self.out.append(escape(data, quote=False))
+
+    def result(self):
+        self.close()
+        # An unclosed <script> or <style> would swallow the rest of the story.
+        # Treat its start tag as stray and replay what followed it.
+        while self.skip_depth:
+            events, self.skipped, self.skip_depth = self.skipped, [], 0
+            for handler, args in events:
+                handler(*args)
+        while self.open_tags:
+            self.out.append('</%s>' % self.open_tags.pop())
+        return ''.join(self.out)
+
+
+def sanitize_html(markup):
+    parser = _Sanitizer()
+    parser.feed(markup)
+    return parser.result()
+
+
+def render_content_html(content):
+    """Safe HTML for a story body.
+
+    Plain text becomes paragraphs and line breaks; markup is reduced to the
+    allowlist above.
+    """
+    content = (content or '').replace('\r\n', '\n')
+    if not LOOKS_LIKE_MARKUP.search(content):
+        paragraphs = [p.strip() for p in PARAGRAPH_BREAK.split(content) if p.strip()]
+        return '\n'.join('<p>%s</p>' % escape(p, quote=False).replace('\n', '<br>') for p in paragraphs)
+    return sanitize_html(content)
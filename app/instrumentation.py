@@ -0,0 +1,183 @@
+"""Per-request SQL instrumentation: query budgets and an N+1 detector.
+
+Every statement executed while handling a request is counted on `flask.g`.
+A route can declare the most queries it should need with @query_budget(n);
+QUERY_BUDGETS (endpoint -> n) overrides those and QUERY_BUDGET_DEFAULT
+covers routes without one. Going over budget logs a warning, or raises
+QueryBudgetExceeded when QUERY_BUDGET_STRICT is set (as in tests).
+
+With SQL_INSTRUMENTATION on (development/staging), each statement is also
+timed and fingerprinted (literals and IN-lists collapsed). Statements that
+repeat NPLUSONE_THRESHOLD times or more are reported, and repeated lazy
+relationship loads -- the `post.author.username` in a loop pattern -- are
+flagged as N+1. The summary goes into an X-SQL-Queries response header, a
+log warning for N+1s, and, with SQL_PANEL on, an HTML panel on the page.
+"""
+import logging
+import re
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, render_template_string, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+_WHITESPACE = re.compile(r'\s+')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = r'(?:\?|%s|%\(\w+\)s|:\w+)'
+_IN_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)+\s*\)' % (_PLACEHOLDER, _PLACEHOLDER))
+
+
+def fingerprint(statement):
+    """Normalize a statement so repeats with different values compare equal."""
+    statement = _WHITESPACE.sub(' ', statement).strip()
+    statement = _LITERALS.sub('?', statement)
+    return _IN_LIST.sub('(?, ...)', statement)
+
+
+class RequestSQLStats:
+    """Statements executed during one request."""
+
+    def __init__(self):
+        self.queries = []  # (fingerprint, milliseconds, lazy load?)
+        self.pending_lazy = False
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_ms(self):
+        return sum(ms for _, ms, _ in self.queries)
+
+    def repeated(self, threshold):
+        counts = Counter(fp for fp, _, _ in self.queries)
+        return [(fp, n) for fp, n in counts.most_common() if n >= threshold]
+
+    def nplusone(self, threshold):
+        counts = Counter(fp for fp, _, lazy in self.queries if lazy)
+        return [(fp, n) for fp, n in counts.most_common() if n >= threshold]
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    g.query_count = g.get('query_count', 0) + 1
+    stats = g.get('sql_stats')
+    if stats is not None:
+        conn.info.setdefault('query_start', []).append((time.perf_counter(), stats.pending_lazy))
+        stats.pending_lazy = False
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    stats = g.get('sql_stats')
+    starts = conn.info.get('query_start')
+    if stats is not None and starts:
+        started, lazy = starts.pop()
+        stats.queries.append((fingerprint(statement), (time.perf_counter() - started) * 1000.0, lazy))
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _mark_lazy_load(orm_execute_state):
+    # Lazy loads run through the session just before their cursor executes
+    if has_request_context() and orm_execute_state.is_relationship_load:
+        stats = g.get('sql_stats')
+        if stats is not None:
+            stats.pending_lazy = True
+
+
+def query_budget(max_queries):
+    """Declare the maximum number of SQL queries a view may run."""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def get_query_budget(endpoint):
+    budgets = current_app.config.get('QUERY_BUDGETS') or {}
+    if endpoint in budgets:
+        return budgets[endpoint]
+    view = current_app.view_functions.get(endpoint)
+    budget = getattr(view, 'query_budget', None)
+    if budget is None:
+        budget = current_app.config.get('QUERY_BUDGET_DEFAULT')
+    return budget
+
+
+def check_query_budget(response):
+    budget = get_query_budget(request.endpoint)
+    count = g.get('query_count', 0)
+    if budget is not None and count > budget:
+        message = '%s ran %d SQL queries (budget %d)' % (request.endpoint, count, budget)
+        if current_app.config.get('QUERY_BUDGET_STRICT'):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+    return response
+
+
+def start_sql_stats():
+    if current_app.config.get('SQL_INSTRUMENTATION'):
+        g.sql_stats = RequestSQLStats()
+
+
+PANEL_TEMPLATE = """
+<div id="sql-panel" style="position:fixed; bottom:0; left:0; right:0; max-height:40%; overflow:auto;
+     background:#111; color:#ddd; font:12px monospace; border-top:2px solid #4a9eff; padding:8px; z-index:9999;">
+  <strong>SQL</strong> {{ stats.count }} queries in {{ '%.1f' % stats.total_ms }} ms
+  {% if nplusone %}<span style="color:#ff6b6b;"> · {{ nplusone|length }} N+1 pattern(s)</span>{% endif %}
+  {% if repeated %}
+  <table style="width:100%; margin-top:6px;">
+    {% for fp, n in repeated %}
+    <tr><td style="width:4em; color:{{ '#ff6b6b' if fp in nplusone_fps else '#ffd166' }};">{{ n }}×</td><td>{{ fp }}</td></tr>
+    {% endfor %}
+  </table>
+  {% endif %}
+</div>
+"""
+
+
+def report_sql_stats(response):
+    stats = g.get('sql_stats')
+    if stats is None:
+        return response
+    threshold = current_app.config.get('NPLUSONE_THRESHOLD', 3)
+    repeated = stats.repeated(threshold)
+    nplusone = stats.nplusone(threshold)
+    summary = '%d; time=%.1fms; repeated=%d; n+1=%d' % (stats.count, stats.total_ms, len(repeated), len(nplusone))
+    if 'pool_wait_ms' in g:
+        # Time spent waiting for a pooled connection (app/pool.py)
+        summary += '; pool_wait=%.1fms' % g.pool_wait_ms
+    response.headers['X-SQL-Queries'] = summary
+    for fp, n in nplusone:
+        logger.warning('N+1 in %s: lazy load ran %d times: %s', request.endpoint, n, fp)
+
+    if current_app.config.get('SQL_PANEL') and response.mimetype == 'text/html' \
+            and not response.direct_passthrough:
+        html = response.get_data(as_text=True)
+        if '</body>' in html:
+            panel = render_template_string(PANEL_TEMPLATE, stats=stats, repeated=repeated,
+                                           nplusone=nplusone, nplusone_fps={fp for fp, _ in nplusone})
+            head, tail = html.rsplit('</body>', 1)
+            response.set_data(head + panel + '</body>' + tail)
+    return response
+
+
+def init_app(app):
+    app.before_request(start_sql_stats)
+    # after_request handlers run in reverse order: report first, then budget
+    app.after_request(check_query_budget)
+    app.after_request(report_sql_stats)
@@ -0,0 +1,71 @@
+"""Read path for listing pages.
+
+Cards on the home, posts, profile, feed and dashboard pages only show a
+title, the stored excerpt, the author's name and counters. Instead of
+hydrating full Post objects into the session, these helpers run Core
+SELECTs of just those columns and wrap each row in a slotted PostCard.
+
+A post the post_derived backfill has not reached yet has no stored excerpt;
+its card is given one made from the first few hundred characters of the
+content, which the query fetches only for those rows.
+"""
+from sqlalchemy import case, func, select
+
+from . import db
+from .content import EXCERPT_LENGTH, make_excerpt
+from .models import Post, User, followers
+
+# Content fetched for a missing excerpt; room for markup that is stripped
+FALLBACK_CHARS = EXCERPT_LENGTH * 4
+
+
+class PostCard:
+    """Read-only view of a post for listing cards."""
+    __slots__ = ('id', 'title', 'date_posted', 'category', 'likes', 'views',
+                 'author_id', 'author_username', 'excerpt', 'reading_time')
+
+    def __init__(self, id, title, date_posted, category, likes, views,
+                 author_id, author_username, excerpt, reading_time, content_head=None):
+        self.id = id
+        self.title = title
+        self.date_posted = date_posted
+        self.category = category
+        self.likes = likes
+        self.views = views
+        self.author_id = author_id
+        self.author_username = author_username
+        self.excerpt = excerpt if excerpt is not None else make_excerpt(content_head)
+        self.reading_time = reading_time
+
+    def __repr__(self):
+        return '<PostCard %r>' % self.id
+
+
+def card_select():
+    return select(
+        Post.id, Post.title, Post.date_posted, Post.category, Post.likes, Post.views,
+        Post.user_id, User.username, Post.excerpt, Post.reading_time,
+        case((Post.excerpt.is_(None), func.substr(Post.content, 1, FALLBACK_CHARS))),
+    ).join(User, User.id == Post.user_id)
+
+
+def by_author(user_id):
+    return Post.user_id == user_id
+
+
+def followed_by(user_id):
+    return Post.user_id.in_(
+        select(followers.c.followed_id).where(followers.c.follower_id == user_id)
+    )
+
+
+def count_posts(*criteria):
+    return db.session.execute(
+        select(func.count()).select_from(Post).where(*criteria)
+    ).scalar()
+
+
+def fetch_cards(*criteria, offset=0, limit=5):
+    """Newest-first PostCards matching the criteria."""
+    stmt = card_select().where(*criteria).order_by(Post.date_posted.desc()).offset(offset).limit(limit)
+    return [PostCard(*row) for row in db.session.execute(stmt)]
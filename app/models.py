@@ -1,19 +1,69 @@
+import functools
 from datetime import datetime
+from flask import current_app, g, has_request_context, url_for
 from flask_login import UserMixin
-from . import db, bcrypt
+from sqlalchemy import event, select
+from sqlalchemy.orm import with_loader_criteria
+from . import db, passwords
+from .partitions import retention_cutoff
+from .content import RENDERER_VERSION, derive_post_metadata, render_content_html
 
 followers = db.Table('followers',
     db.Column('follower_id', db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True),
     db.Column('followed_id', db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True),
-    db.Column('timestamp', db.DateTime, default=datetime.utcnow)
+    db.Column('timestamp', db.DateTime, default=datetime.utcnow),
+    # The primary key covers follower_id lookups; this one serves followers lists
+    db.Index('ix_followers_followed_id', 'followed_id'),
 )
 
+# Request-scoped memo for User helper methods. Templates may ask the same
+# question (unread count, follow state, counters) several times per request;
+# answers are kept on flask.g and dropped whenever the session writes.
+def request_memo(method):
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        if not has_request_context():
+            return method(self, *args)
+        memo = g.setdefault('user_memo', {})
+        key = (method.__name__, self.id) + tuple(getattr(arg, 'id', arg) for arg in args)
+        if key not in memo:
+            memo[key] = method(self, *args)
+        return memo[key]
+    return wrapper
+
+
+def invalidate_request_memo(*args):
+    if has_request_context():
+        g.pop('user_memo', None)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _invalidate_memo_after_flush(session, flush_context):
+    invalidate_request_memo()
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _invalidate_memo_on_bulk_write(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        invalidate_request_memo()
+
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     
     username = db.Column(db.String(64), unique=True, nullable=False)
+    # Case-insensitive lookups go through this indexed copy; see by_username()
+    username_lower = db.Column(db.String(64), unique=True, index=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
     bio = db.Column(db.Text, nullable=True, default='')  
+    # Soft delete: set to hide the user and their content; app/purge.py removes them later
+    deleted_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_user_deleted', 'deleted_at',
+                 postgresql_where=db.text('deleted_at IS NOT NULL'),
+                 sqlite_where=db.text('deleted_at IS NOT NULL')),
+    )
 
     posts = db.relationship('Post', backref='author', cascade='all, delete-orphan', passive_deletes=True)
     comments = db.relationship('Comment', backref='commenter', cascade='all, delete-orphan', passive_deletes=True)
@@ -25,28 +75,82 @@ class User(UserMixin, db.Model):
         backref=db.backref('followers', lazy='dynamic'),
         lazy='dynamic'
     )
-    notifications = db.relationship('Notification', foreign_keys='Notification.user_id', backref='recipient', cascade='all, delete-orphan', passive_deletes=True)
+    notifications = db.relationship('Notification', primaryjoin='User.id == foreign(Notification.user_id)', backref='recipient', cascade='all, delete-orphan', passive_deletes=True)
+
+    @db.validates('username')
+    def _sync_username_lower(self, key, username):
+        self.username_lower = username.lower() if username is not None else None
+        return username
+
+    @staticmethod
+    def by_username(username, include_deleted=False):
+        """Case-insensitive username lookup that uses the username_lower index.
+
+        Deleted users keep their name until they are purged; pass
+        include_deleted=True to check whether a name is really free.
+        """
+        query = User.query.filter(User.username_lower == username.lower())
+        if include_deleted:
+            query = query.execution_options(include_deleted=True)
+        return query
+
+    def soft_delete(self):
+        """Take the account and everything it wrote offline; purged later.
+
+        Until then, notifications about its stories read as deleted ones.
+        """
+        self.deleted_at = datetime.utcnow()
 
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = passwords.hash_password(password)
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return passwords.check_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return passwords.needs_rehash(self.password_hash)
 
     def follow(self, user):
         if not self.is_following(user):
             self.followed.append(user)
+            invalidate_request_memo()
 
     def unfollow(self, user):
         if self.is_following(user):
             self.followed.remove(user)
+            invalidate_request_memo()
 
+    @request_memo
     def is_following(self, user):
-        return self.followed.filter(followers.c.followed_id == user.id).count() > 0
+        return user.id in self.following_ids_among([user.id])
 
+    def following_ids_among(self, user_ids):
+        """Returns the subset of user_ids this user follows, using one query."""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return set()
+        rows = db.session.query(followers.c.followed_id).filter(
+            followers.c.follower_id == self.id,
+            followers.c.followed_id.in_(user_ids)
+        )
+        return {followed_id for followed_id, in rows}
+
+    def liked_post_ids_among(self, post_ids):
+        """Returns the subset of post_ids this user liked, using one query."""
+        post_ids = list(post_ids)
+        if not post_ids:
+            return set()
+        rows = db.session.query(Like.post_id).filter(
+            Like.user_id == self.id,
+            Like.post_id.in_(post_ids)
+        )
+        return {post_id for post_id, in rows}
+
+    @request_memo
     def followers_count(self):
         return self.followers.count()
 
+    @request_memo
     def following_count(self):
         return self.followed.count()
 
@@ -57,30 +161,41 @@ class User(UserMixin, db.Model):
             followers.c.follower_id == self.id
         ).order_by(Post.date_posted.desc())
     
+    @request_memo
     def unread_notifications_count(self):
         """Returns count of unread notifications for this user."""
-        return Notification.query.filter_by(user_id=self.id, is_read=False).count()
+        return Notification.for_user(self.id).filter(Notification.unread()).count()
     
     def get_notifications(self, limit=None, unread_only=False):
         """Returns user's notifications, optionally filtered and limited."""
-        query = Notification.query.filter_by(user_id=self.id)
+        query = Notification.for_user(self.id)
         if unread_only:
-            query = query.filter_by(is_read=False)
+            query = query.filter(Notification.unread())
         query = query.order_by(Notification.created_at.desc())
         if limit:
             query = query.limit(limit)
-        return query.all()
+        return Notification.render_all(query.all())
     
     def mark_notifications_read(self):
         """Marks all notifications as read for this user."""
-        Notification.query.filter_by(user_id=self.id, is_read=False).update({'is_read': True})
+        Notification.for_user(self.id).filter(Notification.unread()).update({'is_read': True})
         db.session.commit()
 
 
 class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(140), nullable=False)
-    content = db.Column(db.Text, nullable=False)
+    # Story bodies can be tens of KB; only load them where they are shown
+    content = db.deferred(db.Column(db.Text, nullable=False))
+    excerpt = db.Column(db.String(300), nullable=True)
+    # Derived from content at write time, see content.derive_post_metadata
+    word_count = db.Column(db.Integer, nullable=True)
+    char_count = db.Column(db.Integer, nullable=True)
+    reading_time = db.Column(db.SmallInteger, nullable=True)  # minutes
+    content_hash = db.Column(db.String(64), nullable=True)
+    # Sanitized HTML of content, rendered on save; see content.RENDERER_VERSION
+    content_html = db.deferred(db.Column(db.Text, nullable=True))
+    content_html_version = db.Column(db.SmallInteger, nullable=True)
     date_posted = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     category = db.Column(db.String(30), nullable=False, default="Others")
 
@@ -90,6 +205,56 @@ class Post(db.Model):
     comments = db.relationship('Comment', backref='post', cascade='all, delete, delete-orphan', passive_deletes=True)
     likes = db.Column(db.Integer, default=0) 
     views = db.Column(db.Integer, default=0) 
+    # Soft delete: set to hide the post at once; app/purge.py removes it later
+    deleted_at = db.Column(db.DateTime, nullable=True)
+
+    # Listings: an author's posts newest first, and all posts newest first
+    __table_args__ = (
+        db.Index('ix_post_user_id_date_posted', 'user_id', 'date_posted'),
+        db.Index('ix_post_date_posted', 'date_posted'),
+        db.Index('ix_post_deleted', 'deleted_at',
+                 postgresql_where=db.text('deleted_at IS NOT NULL'),
+                 sqlite_where=db.text('deleted_at IS NOT NULL')),
+    )
+
+    def soft_delete(self):
+        """Hide the post now; app/purge.py removes its comments and likes later.
+
+        Its notifications go at once, so inboxes and unread counts never
+        point at a hidden post.
+        """
+        self.deleted_at = datetime.utcnow()
+        Notification.delete_for_post(self.id)
+
+    def set_content(self, content):
+        self.content = content
+        for column, value in derive_post_metadata(content).items():
+            setattr(self, column, value)
+        self.content_html = render_content_html(content)
+        self.content_html_version = RENDERER_VERSION
+
+    def refresh_html(self):
+        """Re-render content_html if it came from an older renderer version.
+
+        Returns True when the stored HTML needs saving.
+        """
+        if self.content_html is not None and self.content_html_version == RENDERER_VERSION:
+            return False
+        self.content_html = render_content_html(self.content)
+        self.content_html_version = RENDERER_VERSION
+        return True
+
+    @staticmethod
+    def count_view(connection, post_id):
+        connection.execute(
+            db.update(Post).where(Post.id == post_id).values(views=db.func.coalesce(Post.views, 0) + 1)
+        )
+
+    @staticmethod
+    def save_html(connection, post_id, html, version):
+        connection.execute(
+            db.update(Post).where(Post.id == post_id).values(content_html=html, content_html_version=version)
+        )
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -98,34 +263,186 @@ class Comment(db.Model):
 
     post_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_comment_post_id_date_commented', 'post_id', 'date_commented'),
+        db.Index('ix_comment_user_id', 'user_id'),
+    )
 class Like(db.Model):
+    # Activity tables live on the 'activity' bind, which may be a separate
+    # database, so they carry no foreign keys; app/purge.py cleans them up.
+    __bind_key__ = 'activity'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
-    post_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), nullable=False)
-    __table_args__ = (db.UniqueConstraint('user_id', 'post_id', name='_user_post_like_uc'),)
+    user_id = db.Column(db.Integer, nullable=False)
+    post_id = db.Column(db.Integer, nullable=False)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'post_id', name='_user_post_like_uc'),
+        db.Index('ix_like_post_id', 'post_id'),
+    )
+
+# Compact notification storage: rows keep a type code, the actor (sender_id),
+# a target id and optional small params. Message text and links are rendered
+# at read time so they never go stale when a username or story title changes.
+NOTIFICATION_TYPES = {1: 'like', 2: 'comment', 3: 'follow', 4: 'new_post'}
+NOTIFICATION_CODES = {name: code for code, name in NOTIFICATION_TYPES.items()}
+POST_NOTIFICATION_TYPES = ('like', 'comment', 'new_post')  # target_id is a post id
+
+NOTIFICATION_MESSAGES = {
+    'like': '{actor} liked your story "{title}"',
+    'comment': '{actor} commented on your story "{title}"',
+    'follow': '{actor} started following you',
+    'new_post': '{actor} published a new story "{title}"',
+}
+# For post notifications whose story has been deleted (or its author's account)
+DELETED_TARGET_MESSAGES = {
+    'like': '{actor} liked a story that has since been deleted',
+    'comment': '{actor} commented on a story that has since been deleted',
+    'new_post': '{actor} published a story that has since been deleted',
+}
 
 class Notification(db.Model):
+    __bind_key__ = 'activity'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
-    sender_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=True)
-    notification_type = db.Column(db.String(20), nullable=False)  # 'like', 'comment', 'follow', 'new_post'
-    message = db.Column(db.String(255), nullable=False)
-    link = db.Column(db.String(255), nullable=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    sender_id = db.Column(db.Integer, nullable=True)
+    type_code = db.Column(db.SmallInteger, nullable=False)  # see NOTIFICATION_TYPES
+    target_id = db.Column(db.Integer, nullable=True)  # post id for like/comment/new_post
+    params = db.Column(db.String(64), nullable=True)
     is_read = db.Column(db.Boolean, default=False, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    # A user's notifications newest first; unread ones (counts, the unread
+    # filter) through a smaller partial index. Queries must spell the unread
+    # condition as Notification.unread() so the planner can match it.
+    __table_args__ = (
+        db.Index('ix_notification_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_notification_unread', 'user_id', 'created_at',
+                 postgresql_where=db.text('is_read = false'),
+                 sqlite_where=db.text('is_read = 0')),
+    )
     
-    sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_notifications')
-    
+    sender = db.relationship('User', primaryjoin='foreign(Notification.sender_id) == User.id', backref='sent_notifications')
+
+    @property
+    def notification_type(self):
+        return NOTIFICATION_TYPES.get(self.type_code)
+
+    @property
+    def message(self):
+        """Rendered notification text."""
+        if not hasattr(self, '_actor_name'):
+            Notification.render_all([self])
+        template = NOTIFICATION_MESSAGES.get(self.notification_type, '{actor}')
+        if self.notification_type in POST_NOTIFICATION_TYPES and self._target_title is None:
+            template = DELETED_TARGET_MESSAGES[self.notification_type]
+        return template.format(actor=self._actor_name or 'Someone', title=self._target_title)
+
+    @property
+    def link(self):
+        """Rendered target URL, or None if the target no longer exists."""
+        if not hasattr(self, '_actor_name'):
+            Notification.render_all([self])
+        if self.notification_type in POST_NOTIFICATION_TYPES:
+            if self._target_title is None:
+                return None
+            return url_for('main.post_detail', post_id=self.target_id)
+        if self.notification_type == 'follow' and self._actor_name:
+            return url_for('main.profile', username=self._actor_name)
+        return None
+
     @staticmethod
-    def create_notification(user_id, sender_id, notification_type, message, link=None):
+    def render_all(notifications):
+        """Batch-load actor names and target titles for a page of notifications.
+
+        Uses one query for users and one for posts regardless of page size.
+        """
+        sender_ids = {n.sender_id for n in notifications if n.sender_id}
+        post_ids = {n.target_id for n in notifications
+                    if n.target_id and n.notification_type in POST_NOTIFICATION_TYPES}
+        names = {}
+        titles = {}
+        if sender_ids:
+            names = dict(db.session.query(User.id, User.username).filter(User.id.in_(sender_ids)))
+        if post_ids:
+            titles = dict(db.session.query(Post.id, Post.title).filter(Post.id.in_(post_ids)))
+        for n in notifications:
+            n._actor_name = names.get(n.sender_id)  # None if the sender is gone
+            n._target_title = titles.get(n.target_id) if n.notification_type in POST_NOTIFICATION_TYPES else None
+        return notifications
+
+    @staticmethod
+    def unread():
+        return Notification.is_read == db.false()
+
+    @staticmethod
+    def for_user(user_id):
+        """Query a user's notifications within the retention window.
+
+        The created_at bound lets PostgreSQL prune partitions outside the window.
+        """
+        query = Notification.query.filter_by(user_id=user_id)
+        keep_months = current_app.config.get('NOTIFICATION_RETENTION_MONTHS')
+        if keep_months:
+            query = query.filter(Notification.created_at >= retention_cutoff(keep_months))
+        return query
+
+    @staticmethod
+    def create_notification(user_id, sender_id, notification_type, target_id=None, params=None):
         """Create a new notification."""
         notification = Notification(
             user_id=user_id,
             sender_id=sender_id,
-            notification_type=notification_type,
-            message=message,
-            link=link
+            type_code=NOTIFICATION_CODES[notification_type],
+            target_id=target_id,
+            params=params
         )
         db.session.add(notification)
         db.session.commit()
-        return notification
\ No newline at end of file
+        return notification
+
+    @staticmethod
+    def delete_for_post(post_id):
+        """Delete notifications that point at a post (its id is not a foreign key)."""
+        codes = [NOTIFICATION_CODES[t] for t in POST_NOTIFICATION_TYPES]
+        Notification.query.filter(
+            Notification.target_id == post_id, Notification.type_code.in_(codes)
+        ).delete(synchronize_session=False)
+
+
+class BackfillState(db.Model):
+    """Progress of a batched backfill job (see app/backfill.py)."""
+    name = db.Column(db.String(64), primary_key=True)
+    status = db.Column(db.String(16), nullable=False, default='pending')  # pending/running/paused/done/failed
+    last_id = db.Column(db.Integer, nullable=False, default=0)  # highest primary key processed
+    rows_scanned = db.Column(db.Integer, nullable=False, default=0)
+    rows_changed = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+
+# Soft delete: deleted posts and users, posts by deleted users and comments by
+# deleted users are left out of every ORM query (including relationship loads)
+# until app/purge.py removes them. Use execution_options(include_deleted=True)
+# to see them.
+def _deleted_user_ids():
+    # Core columns, so the User criteria below do not apply to this subquery
+    users = User.__table__
+    return select(users.c.id).where(users.c.deleted_at.is_not(None))
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _hide_deleted_rows(orm_execute_state):
+    if (orm_execute_state.is_select
+            and not orm_execute_state.is_column_load
+            and not orm_execute_state.execution_options.get('include_deleted', False)):
+        orm_execute_state.statement = orm_execute_state.statement.options(
+            with_loader_criteria(User, User.deleted_at.is_(None), include_aliases=True),
+            with_loader_criteria(
+                Post,
+                Post.deleted_at.is_(None) & Post.user_id.not_in(_deleted_user_ids()),
+                include_aliases=True,
+            ),
+            with_loader_criteria(Comment, Comment.user_id.not_in(_deleted_user_ids()), include_aliases=True),
+        )
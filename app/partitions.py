@@ -0,0 +1,150 @@
+"""Monthly range partitions for the notification table on PostgreSQL.
+
+Partitioning is opt-in (NOTIFICATION_PARTITIONING) and only applies to
+PostgreSQL. The migration converts `notification` into a table partitioned
+by RANGE (created_at) with one child per month plus a DEFAULT partition, so
+inserts never fail even if future partitions were not created in time.
+
+Rows that landed in DEFAULT are moved into their month's partition when it
+is created (PostgreSQL refuses to create it otherwise), and retention
+deletes expired rows from DEFAULT in batches.
+"""
+import re
+from datetime import datetime
+
+from sqlalchemy import text
+
+PARENT = 'notification'
+DEFAULT_PARTITION = 'notification_default'
+PARTITION_NAME = re.compile(r'^notification_y(\d{4})m(\d{2})$')
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    index = value.year * 12 + (value.month - 1) + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return 'notification_y%04dm%02d' % (month.year, month.month)
+
+
+def is_postgres(conn):
+    return conn.dialect.name == 'postgresql'
+
+
+def is_partitioned(conn):
+    """True if the notification table is a partitioned parent."""
+    if not is_postgres(conn):
+        return False
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt "
+        "JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+    ), {'name': PARENT}).first() is not None
+
+
+def list_partitions(conn):
+    """Return {month_start: partition name} for existing monthly partitions."""
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :name AND pg_table_is_visible(p.oid)"
+    ), {'name': PARENT}).scalars()
+    partitions = {}
+    for name in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[datetime(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def create_default_partition(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS %s PARTITION OF %s DEFAULT' % (DEFAULT_PARTITION, PARENT)
+    ))
+
+
+def create_partition(conn, month):
+    """Create the partition for `month`, moving its rows out of DEFAULT."""
+    name = partition_name(month)
+    bounds = "FOR VALUES FROM ('%s') TO ('%s')" % (month.isoformat(' '), add_months(month, 1).isoformat(' '))
+    in_month = 'created_at >= :start AND created_at < :end'
+    params = {'start': month, 'end': add_months(month, 1)}
+    stranded = conn.execute(text(
+        'SELECT 1 FROM %s WHERE %s LIMIT 1' % (DEFAULT_PARTITION, in_month)
+    ), params).first()
+    if stranded is None:
+        conn.execute(text('CREATE TABLE IF NOT EXISTS %s PARTITION OF %s %s' % (name, PARENT, bounds)))
+        return name
+    # Fill a standalone table, empty the range in DEFAULT, then attach
+    conn.execute(text('CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS INCLUDING CONSTRAINTS)' % (name, PARENT)))
+    conn.execute(text('INSERT INTO %s SELECT * FROM %s WHERE %s' % (name, DEFAULT_PARTITION, in_month)), params)
+    conn.execute(text('DELETE FROM %s WHERE %s' % (DEFAULT_PARTITION, in_month)), params)
+    conn.execute(text('ALTER TABLE %s ATTACH PARTITION %s %s' % (PARENT, name, bounds)))
+    return name
+
+
+def create_partitions(conn, first_month, last_month):
+    """Create monthly partitions covering first_month..last_month inclusive."""
+    existing = list_partitions(conn)
+    created = []
+    month = month_start(first_month)
+    while month <= last_month:
+        if month not in existing:
+            created.append(create_partition(conn, month))
+        month = add_months(month, 1)
+    return created
+
+
+def ensure_future_partitions(conn, months_ahead, now=None):
+    """Make sure partitions exist for this month and the next `months_ahead`."""
+    if not is_partitioned(conn):
+        return []
+    current = month_start(now or datetime.utcnow())
+    return create_partitions(conn, current, add_months(current, months_ahead))
+
+
+def retention_cutoff(keep_months, now=None):
+    """First instant that is still retained when keeping `keep_months` months."""
+    return add_months(month_start(now or datetime.utcnow()), -(keep_months - 1))
+
+
+def delete_before(conn, table, cutoff, batch_size):
+    """Delete rows of `table` created before `cutoff` in primary-key batches."""
+    deleted = 0
+    while True:
+        ids = conn.execute(text(
+            'SELECT id FROM %s WHERE created_at < :cutoff ORDER BY id LIMIT :limit' % table
+        ), {'cutoff': cutoff, 'limit': batch_size}).scalars().all()
+        if not ids:
+            return deleted
+        conn.execute(text('DELETE FROM %s WHERE id IN (%s)' % (table, ','.join(str(int(i)) for i in ids))))
+        conn.commit()
+        deleted += len(ids)
+
+
+def drop_expired(conn, keep_months, now=None, batch_size=1000):
+    """Apply notification retention.
+
+    On a partitioned table whole monthly partitions older than the cutoff are
+    detached and dropped, which is instant and leaves no dead tuples behind;
+    expired rows in the DEFAULT partition are deleted in batches. Elsewhere
+    old rows are deleted in primary-key batches.
+    Returns (dropped partition names, number of deleted rows).
+    """
+    cutoff = retention_cutoff(keep_months, now)
+    if not is_partitioned(conn):
+        return [], delete_before(conn, PARENT, cutoff, batch_size)
+
+    dropped = []
+    for month, name in sorted(list_partitions(conn).items()):
+        if add_months(month, 1) <= cutoff:
+            conn.execute(text('ALTER TABLE %s DETACH PARTITION %s' % (PARENT, name)))
+            conn.execute(text('DROP TABLE %s' % name))
+            dropped.append(name)
+    return dropped, delete_before(conn, DEFAULT_PARTITION, cutoff, batch_size)
@@ -0,0 +1,112 @@
+"""Password hashing with a concurrency cap and a cost policy.
+
+Hashes run in a small thread pool, and the pool size caps how many hashes
+burn CPU at once. When the pool and its queue are full for
+BCRYPT_QUEUE_TIMEOUT seconds, PasswordServiceBusy is raised and the request
+is turned away instead of piling up.
+
+This does not make hashing non-blocking: the request thread waits for the
+hash to finish. With gunicorn's default sync worker a login still ties up
+the whole worker for the duration of the hash. Run threaded workers
+(`gunicorn --threads 4 ...`, the gthread worker) or gevent so that other
+requests are served meanwhile; bcrypt releases the GIL, so the other
+threads keep running.
+
+The cost factor is BCRYPT_LOG_ROUNDS, or, when BCRYPT_TARGET_MS is set, the
+cost that takes about that long on this host, measured once at startup.
+Hashes with a different cost are upgraded on the next successful login
+(see needs_rehash()).
+"""
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from . import bcrypt
+
+MIN_LOG_ROUNDS = 4
+MAX_LOG_ROUNDS = 16
+CALIBRATION_ROUNDS = 8
+
+
+class PasswordServiceBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, log_rounds, max_concurrency, queue_timeout):
+        self.log_rounds = log_rounds
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='bcrypt')
+        # Running plus queued hashes; twice the pool keeps a short queue
+        self._slots = threading.BoundedSemaphore(max_concurrency * 2)
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise PasswordServiceBusy('Too many password checks in progress')
+        try:
+            # Blocks this thread until the hash is done; the pool only bounds concurrency
+            return self._executor.submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(bcrypt.generate_password_hash, password, self.log_rounds).decode('utf-8')
+
+    def check(self, password_hash, password):
+        return self._run(bcrypt.check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return hash_cost(password_hash) != self.log_rounds
+
+
+def hash_cost(password_hash):
+    """The cost factor of a '$2b$12$...' bcrypt hash, or None."""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def calibrate(target_ms, minimum=MIN_LOG_ROUNDS):
+    """The cost whose hash takes about target_ms on this host.
+
+    Times one hash at a cheap cost and scales up, since every extra round
+    doubles the work.
+    """
+    started = time.perf_counter()
+    bcrypt.generate_password_hash('calibration', CALIBRATION_ROUNDS)
+    elapsed_ms = max((time.perf_counter() - started) * 1000.0, 0.01)
+    rounds = CALIBRATION_ROUNDS + round(math.log2(target_ms / elapsed_ms))
+    return min(MAX_LOG_ROUNDS, max(minimum, rounds))
+
+
+def get_hasher():
+    return current_app.extensions['passwords']
+
+
+def hash_password(password):
+    return get_hasher().hash(password)
+
+
+def check_password(password_hash, password):
+    return get_hasher().check(password_hash, password)
+
+
+def needs_rehash(password_hash):
+    return get_hasher().needs_rehash(password_hash)
+
+
+def init_app(app):
+    log_rounds = app.config['BCRYPT_LOG_ROUNDS']
+    target_ms = app.config.get('BCRYPT_TARGET_MS')
+    if target_ms:
+        log_rounds = calibrate(target_ms, app.config.get('BCRYPT_MIN_LOG_ROUNDS', MIN_LOG_ROUNDS))
+        app.logger.info('bcrypt cost %d (target %d ms)', log_rounds, target_ms)
+    app.extensions['passwords'] = PasswordHasher(
+        log_rounds,
+        app.config['BCRYPT_MAX_CONCURRENCY'],
+        app.config['BCRYPT_QUEUE_TIMEOUT'],
+    )
@@ -0,0 +1,123 @@
+"""Connection pool for server databases (PostgreSQL), with checkout metrics.
+
+SQLALCHEMY_ENGINE_OPTIONS (see Config) sizes the pool from the environment.
+Every worker process has its own pool, so the database sees up to
+WEB_CONCURRENCY x (pool_size + max_overflow) connections; init_app logs that
+figure at startup so it can be checked against max_connections.
+
+TimedQueuePool measures how long each checkout waits for a free connection.
+Time spent opening a new connection is not counted, so the figure reflects
+pool starvation only. Totals are kept on the pool (`engine.pool.stats`),
+waits are added to the request's `g.pool_wait_ms`, and a checkout slower
+than DB_POOL_SLOW_CHECKOUT_MS is logged. A pool that is too small for the
+worker's threads shows up here first.
+
+The timing overrides QueuePool._do_get and Pool._create_connection, which
+are SQLAlchemy internals (SQLAlchemy is pinned in requirements.txt). If a
+future version drops them, TIMING_SUPPORTED is False and the plain
+QueuePool is used.
+"""
+import logging
+import os
+import threading
+import time
+
+from flask import g, has_request_context
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+TIMING_SUPPORTED = all(callable(getattr(QueuePool, name, None)) for name in ('_do_get', '_create_connection'))
+
+
+class CheckoutStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def record(self, wait_ms, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def as_dict(self):
+        return {
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'avg_wait_ms': self.total_wait_ms / self.checkouts if self.checkouts else 0.0,
+            'max_wait_ms': self.max_wait_ms,
+        }
+
+
+class TimedQueuePool(QueuePool):
+    slow_checkout_ms = 100
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = CheckoutStats()
+        self._connecting = threading.local()
+
+    def _create_connection(self):
+        # Called from _do_get when the pool may grow; connecting is not waiting
+        started = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            self._connecting.ms = getattr(self._connecting, 'ms', 0.0) + (time.perf_counter() - started) * 1000.0
+
+    def _do_get(self):
+        self._connecting.ms = 0.0
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            timed_out = True
+            raise
+        finally:
+            wait_ms = max(0.0, (time.perf_counter() - started) * 1000.0 - self._connecting.ms)
+            self.stats.record(wait_ms, timed_out)
+            if has_request_context():
+                g.pool_wait_ms = g.get('pool_wait_ms', 0.0) + wait_ms
+            if wait_ms > self.slow_checkout_ms:
+                logger.warning('Waited %.0f ms for a database connection (%s)', wait_ms, self.status())
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def describe_pool(engine, options):
+    """One-line summary of a pool, from its public API and the engine options."""
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return '%s (%s)' % (type(pool).__name__, engine.url.get_backend_name())
+    max_overflow = options.get('max_overflow', 10)
+    capacity = pool.size() + max(max_overflow, 0)
+    workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+    return ('%s size=%d max_overflow=%d timeout=%ss recycle=%ss pre_ping=%s; '
+            '%d connection(s) per worker x WEB_CONCURRENCY=%d = up to %d' % (
+                type(pool).__name__, pool.size(), max_overflow, pool.timeout(),
+                options.get('pool_recycle', -1), options.get('pool_pre_ping', False),
+                capacity, workers, capacity * workers))
+
+
+def init_app(app):
+    TimedQueuePool.slow_checkout_ms = app.config.get('DB_POOL_SLOW_CHECKOUT_MS', 100)
+    with app.app_context():
+        seen = set()
+        for key, engine in db.engines.items():
+            if id(engine) in seen or engine.dialect.name == 'sqlite':
+                continue
+            seen.add(id(engine))
+            options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+            app.logger.info('Database pool for %s: %s', key or 'default', describe_pool(engine, options))
@@ -0,0 +1,150 @@
+"""Background purge of soft-deleted posts and users.
+
+Deleting a post or an account only sets deleted_at, which hides it at once
+(see the criteria at the end of app/models.py). This module removes the rows
+later, in small steps. Dependent rows are deleted in primary-key chunks of
+PURGE_BATCH_SIZE, one short transaction per chunk, sleeping PURGE_PAUSE
+seconds between chunks, so no transaction holds many row locks or grows the
+WAL by much. Each step is idempotent, so a purge that is interrupted, or
+running in two workers at once, just picks up where the data is.
+
+Removing a user's likes recounts Post.likes for the posts they had liked.
+
+A daemon thread started with the first request runs purge_deleted() every
+PURGE_INTERVAL seconds; `flask purge run` does the same on demand.
+"""
+import threading
+import time
+
+from sqlalchemy import delete, func, select, tuple_, update
+
+from . import db
+from .models import (
+    Comment, Like, Notification, Post, User, followers,
+    NOTIFICATION_CODES, POST_NOTIFICATION_TYPES,
+)
+
+
+class Purger:
+    def __init__(self, batch_size, pause):
+        self.batch_size = batch_size
+        self.pause = pause
+        self.deleted = {}  # table name -> rows deleted
+
+    def delete_in_chunks(self, engine, table, criterion, key=None, after_chunk=None):
+        """Delete rows matching criterion, batch_size rows per transaction."""
+        key = key or [table.c.id]
+        while True:
+            with engine.begin() as conn:
+                rows = conn.execute(
+                    select(*key).where(criterion).order_by(*key).limit(self.batch_size)
+                ).fetchall()
+                if not rows:
+                    return
+                if len(key) == 1:
+                    conn.execute(delete(table).where(key[0].in_([row[0] for row in rows])))
+                else:
+                    conn.execute(delete(table).where(tuple_(*key).in_([tuple(row) for row in rows])))
+            self.deleted[table.name] = self.deleted.get(table.name, 0) + len(rows)
+            if after_chunk is not None:
+                after_chunk(rows)
+            time.sleep(self.pause)
+
+    def purge_post(self, post_id):
+        main, activity = db.engines[None], db.engines['activity']
+        comments, likes, notifications = Comment.__table__, Like.__table__, Notification.__table__
+        post_codes = [NOTIFICATION_CODES[t] for t in POST_NOTIFICATION_TYPES]
+        self.delete_in_chunks(main, comments, comments.c.post_id == post_id)
+        self.delete_in_chunks(activity, likes, likes.c.post_id == post_id)
+        self.delete_in_chunks(activity, notifications, (notifications.c.target_id == post_id)
+                              & notifications.c.type_code.in_(post_codes))
+        self.delete_in_chunks(main, Post.__table__, Post.__table__.c.id == post_id)
+
+    def purge_user(self, user_id):
+        main, activity = db.engines[None], db.engines['activity']
+        posts, comments, likes, notifications = (
+            Post.__table__, Comment.__table__, Like.__table__, Notification.__table__)
+
+        while True:
+            with main.connect() as conn:
+                post_ids = conn.execute(
+                    select(posts.c.id).where(posts.c.user_id == user_id).order_by(posts.c.id).limit(self.batch_size)
+                ).scalars().all()
+            if not post_ids:
+                break
+            for post_id in post_ids:
+                self.purge_post(post_id)
+
+        self.delete_in_chunks(main, comments, comments.c.user_id == user_id)
+        self.delete_in_chunks(activity, likes, likes.c.user_id == user_id,
+                              key=[likes.c.id, likes.c.post_id],
+                              after_chunk=lambda rows: recount_likes({post_id for _, post_id in rows}))
+        self.delete_in_chunks(main, followers, (followers.c.follower_id == user_id)
+                              | (followers.c.followed_id == user_id),
+                              key=[followers.c.follower_id, followers.c.followed_id])
+        self.delete_in_chunks(activity, notifications, (notifications.c.user_id == user_id)
+                              | (notifications.c.sender_id == user_id))
+        self.delete_in_chunks(main, User.__table__, User.__table__.c.id == user_id)
+
+
+def recount_likes(post_ids):
+    """Set Post.likes from the like table (which may be in another database)."""
+    if not post_ids:
+        return
+    likes = Like.__table__
+    with db.engines['activity'].connect() as conn:
+        counts = dict(conn.execute(
+            select(likes.c.post_id, func.count()).where(likes.c.post_id.in_(post_ids)).group_by(likes.c.post_id)
+        ).fetchall())
+    with db.engines[None].begin() as conn:
+        for post_id in post_ids:
+            conn.execute(update(Post.__table__).where(Post.__table__.c.id == post_id)
+                         .values(likes=counts.get(post_id, 0)))
+
+
+def pending(table):
+    with db.engines[None].connect() as conn:
+        return conn.execute(
+            select(table.c.id).where(table.c.deleted_at.is_not(None)).order_by(table.c.id)
+        ).scalars().all()
+
+
+def purge_deleted(batch_size, pause):
+    """Remove every soft-deleted post and user; returns rows deleted per table."""
+    purger = Purger(batch_size, pause)
+    for post_id in pending(Post.__table__):
+        purger.purge_post(post_id)
+    for user_id in pending(User.__table__):
+        purger.purge_user(user_id)
+    return purger.deleted
+
+
+class PurgeThread(threading.Thread):
+    def __init__(self, app):
+        super().__init__(name='soft-delete-purge', daemon=True)
+        self.app = app
+
+    def run(self):
+        config = self.app.config
+        while True:
+            time.sleep(config['PURGE_INTERVAL'])
+            with self.app.app_context():
+                try:
+                    purge_deleted(config['PURGE_BATCH_SIZE'], config['PURGE_PAUSE'])
+                except Exception:
+                    self.app.logger.exception('Purging soft-deleted rows failed')
+
+
+def init_app(app):
+    if not app.config.get('PURGE_INTERVAL'):
+        return
+    lock = threading.Lock()
+    started = []
+
+    @app.before_request
+    def start_purge_thread():
+        if not started:
+            with lock:
+                if not started:
+                    PurgeThread(app).start()
+                    started.append(True)
@@ -0,0 +1,182 @@
+"""Token-bucket rate limiting for login, registration and write endpoints.
+
+Each limited view gets a bucket per client IP and, for logged-in users, per
+user id. A bucket holds up to N tokens and refills at N per period ("10/minute"
+allows bursts of 10 and 10 a minute after that); every request takes one.
+An empty bucket gets a bare 429 with Retry-After (JSON under /api/). That
+check runs before the view and before login_required, so it does no
+database or bcrypt work. The user id comes straight from the session cookie.
+
+Buckets live in process memory, or in Redis when RATELIMIT_STORAGE_URL is
+set and the redis package is installed, so that all workers share them.
+Limits given in the decorators can be overridden per name in RATELIMITS, e.g.
+{'login': {'ip': '5/minute'}}.
+
+Behind a proxy or load balancer (the Heroku router) request.remote_addr is
+the proxy's address, so every visitor would share one IP bucket. Set
+RATELIMIT_TRUSTED_PROXIES to the number of proxies that append to
+X-Forwarded-For. With RATELIMIT_BEHIND_PROXY on (the default when DYNO is set)
+and no trusted proxies, IP buckets are skipped and only the per-user limits
+apply; a warning is logged at startup.
+"""
+import functools
+import threading
+import time
+
+from flask import current_app, jsonify, request, session
+
+try:
+    import redis
+except ImportError:  # optional shared backend
+    redis = None
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+MAX_MEMORY_KEYS = 10000
+
+
+def parse_rate(rate):
+    """'10/minute' -> (capacity 10, refill rate in tokens per second)."""
+    count, _, period = rate.partition('/')
+    count = int(count)
+    return count, count / PERIODS[period.strip().rstrip('s')]
+
+
+class MemoryBuckets:
+    """Buckets for this process only."""
+
+    def __init__(self):
+        self._buckets = {}  # key -> (tokens, updated at, full again at)
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        """Take a token; returns (allowed, seconds until one is available)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            if len(self._buckets) > MAX_MEMORY_KEYS:
+                self._prune(now)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+    def _prune(self, now):
+        # A bucket that has refilled completely is the same as no bucket
+        for key in [k for k, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+            del self._buckets[key]
+
+
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBuckets:
+    """Buckets shared by every worker through Redis (one atomic script call)."""
+
+    def __init__(self, url):
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(TAKE_SCRIPT)
+
+    def take(self, key, capacity, rate):
+        allowed, tokens = self._take(keys=['ratelimit:' + key], args=[capacity, rate, time.time()])
+        if allowed:
+            return True, 0
+        return False, (1 - float(tokens)) / rate
+
+
+def client_ip():
+    """The client's address, or None if only the proxy's address is known."""
+    # Behind N trusted proxies, the client is the Nth address from the right
+    proxies = current_app.config.get('RATELIMIT_TRUSTED_PROXIES', 0)
+    if proxies:
+        forwarded = [a.strip() for a in request.headers.get('X-Forwarded-For', '').split(',') if a.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    elif current_app.config.get('RATELIMIT_BEHIND_PROXY'):
+        return None
+    elif 'X-Forwarded-For' in request.headers and 'ratelimit_proxy_warned' not in current_app.extensions:
+        # The header is client-supplied here, so it is only worth a warning
+        current_app.extensions['ratelimit_proxy_warned'] = True
+        current_app.logger.warning('Requests carry X-Forwarded-For but RATELIMIT_TRUSTED_PROXIES is 0; '
+                                   'if the app is behind a proxy, all clients share one IP bucket')
+    return request.remote_addr or 'unknown'
+
+
+def too_many_requests(retry_after):
+    retry_after = max(1, int(retry_after + 0.999))
+    if request.path.startswith('/api/'):
+        response = jsonify({'success': False, 'error': 'Too many requests. Please slow down.'})
+    else:
+        response = current_app.response_class('Too many requests. Please slow down.', mimetype='text/plain')
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def check_limits(name, limits):
+    buckets = current_app.extensions.get('ratelimit')
+    if buckets is None:
+        return None
+    limits = dict(limits, **(current_app.config.get('RATELIMITS') or {}).get(name, {}))
+    keys = []
+    ip = client_ip() if limits.get('ip') else None
+    if ip is not None:
+        keys.append(('%s:ip:%s' % (name, ip), limits['ip']))
+    user_id = session.get('_user_id')
+    if limits.get('user') and user_id:
+        keys.append(('%s:user:%s' % (name, user_id), limits['user']))
+    for key, rate in keys:
+        allowed, retry_after = buckets.take(key, *parse_rate(rate))
+        if not allowed:
+            return too_many_requests(retry_after)
+    return None
+
+
+def rate_limit(name, ip=None, user=None, methods=('POST',)):
+    """Limit a view's requests per client IP and per logged-in user.
+
+    Place it directly under @main.route so it runs before login_required.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            if request.method in methods:
+                response = check_limits(name, {'ip': ip, 'user': user})
+                if response is not None:
+                    return response
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def init_app(app):
+    if not app.config.get('RATELIMIT_ENABLED'):
+        return
+    url = app.config.get('RATELIMIT_STORAGE_URL')
+    if url and redis is not None:
+        app.extensions['ratelimit'] = RedisBuckets(url)
+    else:
+        if url:
+            app.logger.warning('RATELIMIT_STORAGE_URL is set but redis is not installed; '
+                               'using per-process rate limits')
+        app.extensions['ratelimit'] = MemoryBuckets()
+    if app.config.get('RATELIMIT_BEHIND_PROXY') and not app.config.get('RATELIMIT_TRUSTED_PROXIES'):
+        app.logger.warning('Behind a proxy with RATELIMIT_TRUSTED_PROXIES=0: per-IP rate limits are off; '
+                           'set RATELIMIT_TRUSTED_PROXIES to the number of proxies (1 on Heroku)')
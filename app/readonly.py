@@ -0,0 +1,93 @@
+"""Read-only database mode for safe requests.
+
+GET and HEAD requests run with a read-only session: autoflush and
+expire_on_commit are off, and the transaction itself is read-only
+(`SET TRANSACTION READ ONLY` on PostgreSQL, `PRAGMA query_only` on SQLite),
+so the database can skip write bookkeeping and such requests are safe to
+send to a replica. Views that really must write on GET opt out with
+@read_write.
+
+Small side effects of reads, such as counting a post view, are queued with
+defer_write() and run after the view in their own short write transaction
+on the primary.
+"""
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+from . import db
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def read_write(view):
+    """Keep a view's GET requests in normal read-write mode."""
+    view.read_write = True
+    return view
+
+
+def is_read_only():
+    return has_request_context() and g.get('read_only', False)
+
+
+def begin_request():
+    if not current_app.config.get('READ_ONLY_SAFE_REQUESTS'):
+        return
+    view = current_app.view_functions.get(request.endpoint)
+    if request.method in SAFE_METHODS and not getattr(view, 'read_write', False):
+        g.read_only = True
+        session = db.session()
+        session.autoflush = False
+        session.expire_on_commit = False
+
+
+@event.listens_for(db.session, 'after_begin')
+def _begin_read_only_transaction(session, transaction, connection):
+    if not is_read_only():
+        return
+    # Use the DBAPI cursor directly so this bookkeeping is not counted as a query
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        statement = 'SET TRANSACTION READ ONLY'
+    elif dialect == 'sqlite':
+        statement = 'PRAGMA query_only = ON'
+        connection.info['query_only'] = True
+    else:
+        return
+    cursor = connection.connection.dbapi_connection.cursor()
+    cursor.execute(statement)
+    cursor.close()
+
+
+@event.listens_for(Pool, 'checkin')
+def _reset_query_only(dbapi_connection, connection_record):
+    # query_only is a connection setting on SQLite; clear it before reuse
+    if dbapi_connection is not None and connection_record.info.pop('query_only', False):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA query_only = OFF')
+        cursor.close()
+
+
+def defer_write(func, *args):
+    """Run func(connection, *args) after the view, in its own write transaction."""
+    g.setdefault('deferred_writes', []).append((func, args))
+
+
+def run_deferred_writes(exc=None):
+    writes = g.pop('deferred_writes', None)
+    if not writes:
+        return
+    # End the request's (read-only) transaction first; on SQLite an open
+    # reader on this thread would otherwise block the write.
+    db.session.close()
+    try:
+        with db.engine.begin() as connection:
+            for func, args in writes:
+                func(connection, *args)
+    except Exception:
+        current_app.logger.exception('Deferred write failed')
+
+
+def init_app(app):
+    app.before_request(begin_request)
+    app.teardown_request(run_deferred_writes)
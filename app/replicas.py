@@ -0,0 +1,176 @@
+"""Send read-only requests to read replicas.
+
+With DATABASE_REPLICA_URLS set, each replica becomes a bind ('replica_0',
+...). RoutingSession.get_bind() hands the request a replica when:
+- the request is read-only (see app/readonly.py);
+- the statement would otherwise go to the primary (default) engine;
+- it is not a write or a flush;
+- the visitor is outside their read-your-writes window.
+
+Each request sticks to one replica, picked round-robin.
+
+Read-your-writes: every write request (non-GET/HEAD/OPTIONS) stamps the
+visitor's session cookie. For REPLICA_READ_YOUR_WRITES seconds afterwards
+their reads stay on the primary, so they see their own comment, like or
+edit even if the replicas lag behind.
+
+Health: a replica is probed with SELECT 1 on a raw connection at most every
+REPLICA_HEALTH_INTERVAL seconds. Probes run on a background thread, never
+in a request, so an unreachable replica cannot stall a page for the connect
+timeout. Until its first probe succeeds a replica is not used; while a
+re-check is running the last result stands. A replica is also marked down
+the moment one of its connections fails. A replica that is down is
+re-probed every REPLICA_RETRY_SECONDS, and if no replica is up, reads use
+the primary.
+"""
+import itertools
+import logging
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask import session as cookie_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger(__name__)
+
+READ_YOUR_WRITES_KEY = '_rw_until'
+
+
+class ReplicaRouter:
+    def __init__(self, bind_keys, health_interval, retry_seconds):
+        self.bind_keys = list(bind_keys)
+        self.health_interval = health_interval
+        self.retry_seconds = retry_seconds
+        self._cycle = itertools.cycle(self.bind_keys)
+        self._health = {}  # bind key -> (healthy, checked at)
+        self._probes = {}  # bind key -> running probe thread
+        self._lock = threading.Lock()
+
+    def pick(self, engines):
+        """A healthy replica engine, or None to use the primary."""
+        now = time.monotonic()
+        for _ in range(len(self.bind_keys)):
+            with self._lock:
+                key = next(self._cycle)
+            if self._is_healthy(key, engines[key], now):
+                return engines[key]
+        return None
+
+    def _is_healthy(self, key, engine, now):
+        healthy, checked_at = self._health.get(key, (None, 0))
+        wait = self.health_interval if healthy else self.retry_seconds
+        if healthy is None or now - checked_at >= wait:
+            self._probe_in_background(key, engine)
+        return bool(healthy)
+
+    def _probe_in_background(self, key, engine):
+        with self._lock:
+            if key in self._probes:
+                return self._probes[key]
+            thread = threading.Thread(target=self._probe, args=(key, engine),
+                                      name='replica-probe-%s' % key, daemon=True)
+            self._probes[key] = thread
+        thread.start()
+        return thread
+
+    def _probe(self, key, engine):
+        try:
+            healthy = probe(engine)
+            if not healthy:
+                logger.warning('Read replica %s is unavailable; reading from the primary', key)
+            self._health[key] = (healthy, time.monotonic())
+        finally:
+            with self._lock:
+                self._probes.pop(key, None)
+
+    def check_all(self, engines, wait=False):
+        """Probe every replica in the background; wait=True blocks until done."""
+        threads = [self._probe_in_background(key, engines[key]) for key in self.bind_keys]
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def mark_down(self, key):
+        self._health[key] = (False, time.monotonic())
+
+
+def probe(engine):
+    # A raw connection, so the check is not counted as one of the request's queries
+    try:
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SELECT 1')
+            cursor.close()
+        finally:
+            connection.close()
+        return True
+    except Exception:
+        return False
+
+
+def in_read_your_writes_window():
+    return cookie_session.get(READ_YOUR_WRITES_KEY, 0) > time.time()
+
+
+def replica_for(session, engine, clause):
+    if not has_request_context() or not g.get('read_only'):
+        return None
+    router = current_app.extensions.get('replicas')
+    if router is None or engine is not session._db.engines[None]:
+        return None
+    if isinstance(clause, UpdateBase) or in_read_your_writes_window():
+        return None
+    if 'replica_engine' not in g:
+        g.replica_engine = router.pick(session._db.engines)
+    return g.replica_engine
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that reads from a replica when it safely can."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or self._flushing:
+            return engine
+        return replica_for(self, engine, clause) or engine
+
+
+def replica_bind_keys(app):
+    return ['replica_%d' % i for i in range(len(app.config.get('DATABASE_REPLICA_URLS') or []))]
+
+
+def add_replica_binds(app):
+    """Register each replica URL as a bind; call before db.init_app()."""
+    for key, url in zip(replica_bind_keys(app), app.config.get('DATABASE_REPLICA_URLS') or []):
+        app.config['SQLALCHEMY_BINDS'].setdefault(key, url)
+
+
+def init_app(app):
+    keys = replica_bind_keys(app)
+    if not keys:
+        return
+    from . import db
+    from .readonly import SAFE_METHODS
+
+    router = ReplicaRouter(keys, app.config['REPLICA_HEALTH_INTERVAL'], app.config['REPLICA_RETRY_SECONDS'])
+    app.extensions['replicas'] = router
+
+    with app.app_context():
+        for key in keys:
+            def mark_down(context, key=key):
+                if context.is_disconnect or context.connection is None:
+                    router.mark_down(key)
+            event.listen(db.engines[key], 'handle_error', mark_down)
+        router.check_all(db.engines)
+
+    window = app.config['REPLICA_READ_YOUR_WRITES']
+
+    @app.after_request
+    def start_read_your_writes_window(response):
+        if request.method not in SAFE_METHODS:
+            cookie_session[READ_YOUR_WRITES_KEY] = time.time() + window
+        return response
@@ -1,16 +1,48 @@
-from flask import render_template, url_for, flash, redirect, request, Blueprint, abort, jsonify
+from flask import render_template, url_for, flash, redirect, request, Blueprint, abort, jsonify, g
 from flask_login import login_user, current_user, logout_user, login_required
-from . import db, bcrypt
+from . import db
 from .models import User, Post, Comment, Like, Notification
-from sqlalchemy import func
+from sqlalchemy.orm import joinedload, undefer
+from .instrumentation import query_budget
+from . import listings
+from .readonly import defer_write
+from .passwords import PasswordServiceBusy
+from .ratelimit import rate_limit
+from .username_filter import is_username_available
 from .ai_helper import continue_story, generate_story_starter, suggest_titles, improve_writing, get_writing_suggestions
 
 main = Blueprint('main', __name__)
 
+# Helper: which of these users the viewer follows (one query for the whole page)
+def viewer_following_ids(users):
+    if not current_user.is_authenticated:
+        return set()
+    return current_user.following_ids_among(u.id for u in users)
+
+# Helper: which of these posts the viewer liked; cached on g for the request
+def viewer_liked_ids(posts):
+    if not current_user.is_authenticated:
+        return set()
+    cache = g.setdefault('liked_post_ids', {})
+    missing = [post.id for post in posts if post.id not in cache]
+    if missing:
+        liked = current_user.liked_post_ids_among(missing)
+        cache.update((post_id, post_id in liked) for post_id in missing)
+    return {post_id for post_id, liked in cache.items() if liked}
+
 # Helper: pagination
 def paginate(query, page, per_page=5):
     total = query.count()
     items = query.offset((page-1)*per_page).limit(per_page).all()
+    return page_dict(items, total, page, per_page)
+
+# Helper: paginated post cards (column projection, see listings.py)
+def paginate_cards(page, *criteria, per_page=5):
+    total = listings.count_posts(*criteria)
+    items = listings.fetch_cards(*criteria, offset=(page-1)*per_page, limit=per_page)
+    return page_dict(items, total, page, per_page)
+
+def page_dict(items, total, page, per_page):
     pages = (total + per_page - 1)//per_page
     return {
         'items': items,
@@ -27,27 +59,28 @@ def paginate(query, page, per_page=5):
 # Home / Posts feed
 @main.route('/')
 @main.route('/home')
+@query_budget(5)
 def home():
     page = request.args.get('page', 1, type=int)
-    q = Post.query.order_by(Post.date_posted.desc())
-    p = paginate(q, page, per_page=5)
-    return render_template('index.html', posts=p['items'], p=p)
+    p = paginate_cards(page, per_page=5)
+    return render_template('index.html', posts=p['items'], p=p, liked_ids=viewer_liked_ids(p['items']))
 
 @main.route('/posts')
+@query_budget(5)
 def posts():
     page = request.args.get('page', 1, type=int)
-    q = Post.query.order_by(Post.date_posted.desc())
-    p = paginate(q, page, per_page=5)
-    return render_template('index.html', posts=p['items'], p=p)
+    p = paginate_cards(page, per_page=5)
+    return render_template('index.html', posts=p['items'], p=p, liked_ids=viewer_liked_ids(p['items']))
 
 # User profile
 @main.route('/profile/<username>')
+@query_budget(8)
 def profile(username):
-    user = User.query.filter(func.lower(User.username) == username.lower()).first_or_404()
+    user = User.by_username(username).first_or_404()
     page = request.args.get('page', 1, type=int)
-    q = Post.query.filter_by(author=user).order_by(Post.date_posted.desc())
-    p = paginate(q, page, per_page=5)
-    return render_template('profile.html', user=user, posts=p['items'], p=p)
+    p = paginate_cards(page, listings.by_author(user.id), per_page=5)
+    is_following = user.id in viewer_following_ids([user])
+    return render_template('profile.html', user=user, posts=p['items'], p=p, is_following=is_following)
 
 # Edit profile
 @main.route('/profile/edit', methods=['GET', 'POST'])
@@ -63,6 +96,7 @@ def edit_profile():
 
 # Register
 @main.route('/register', methods=['GET', 'POST'])
+@rate_limit('register', ip='10/hour')
 def register():
     if current_user.is_authenticated:
         return redirect(url_for('main.home'))
@@ -73,19 +107,34 @@ def register():
             flash('Username and password are required.', 'danger')
             return redirect(url_for('main.register'))
         # Case-insensitive uniqueness check
-        if User.query.filter(func.lower(User.username) == username.lower()).first():
+        if User.by_username(username, include_deleted=True).first():
             flash('Username already taken. Please choose another.', 'warning')
             return redirect(url_for('main.register'))
         user = User(username=username)
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except PasswordServiceBusy:
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('register.html'), 503
         db.session.add(user)
         db.session.commit()
         flash('Registration successful! You can now log in.', 'success')
         return redirect(url_for('main.login'))
     return render_template('register.html')
 
+# Live availability check for the register form; most answers need no query
+@main.route('/api/username-available')
+@rate_limit('username-check', ip='120/minute', methods=('GET',))
+@query_budget(3)
+def api_username_available():
+    username = request.args.get('username', '').strip()
+    if not username:
+        return jsonify({'success': False, 'error': 'Username is required'}), 400
+    return jsonify({'success': True, 'username': username, 'available': is_username_available(username)})
+
 # Login
 @main.route('/login', methods=['GET', 'POST'])
+@rate_limit('login', ip='10/minute')
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('main.home'))
@@ -93,8 +142,22 @@ def login():
         username = request.form.get('username', '').strip()
         password = request.form.get('password', '').strip()
         # Case-insensitive user lookup
-        user = User.query.filter(func.lower(User.username) == username.lower()).first()
-        if user and user.check_password(password):
+        user = User.by_username(username).first()
+        try:
+            valid = user is not None and user.check_password(password)
+        except PasswordServiceBusy:
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('login.html'), 503
+        if valid:
+            # Upgrade the stored hash to the current cost factor; if the
+            # hasher is saturated, skip it and try again on the next login
+            if user.password_needs_rehash():
+                try:
+                    user.set_password(password)
+                except PasswordServiceBusy:
+                    pass
+                else:
+                    db.session.commit()
             login_user(user)
             flash('Logged in successfully.', 'success')
             next_page = request.args.get('next')
@@ -114,10 +177,10 @@ def logout():
 # Dashboard
 @main.route('/dashboard')
 @login_required
+@query_budget(5)
 def dashboard():
     page = request.args.get('page', 1, type=int)
-    q = Post.query.filter_by(author=current_user).order_by(Post.date_posted.desc())
-    p = paginate(q, page, per_page=5)
+    p = paginate_cards(page, listings.by_author(current_user.id), per_page=5)
     return render_template('dashboard.html', my_posts=p['items'], p=p, username=current_user.username)
 
 # Create post
@@ -136,10 +199,10 @@ def new_post():
 
         post = Post(
             title=title,
-            content=content,
             category=category,
             author=current_user
         )
+        post.set_content(content)
 
         db.session.add(post)
         db.session.commit()
@@ -152,8 +215,7 @@ def new_post():
                 user_id=follower.id,
                 sender_id=current_user.id,
                 notification_type='new_post',
-                message=f'{current_user.username} published a new story "{title}"',
-                link=url_for('main.post_detail', post_id=post.id)
+                target_id=post.id
             )
         return redirect(url_for('main.post_detail', post_id=post.id))
 
@@ -163,7 +225,7 @@ def new_post():
 @main.route('/post/<int:post_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_post(post_id):
-    post = Post.query.get_or_404(post_id)
+    post = Post.query.options(undefer(Post.content)).get_or_404(post_id)
     if post.author != current_user:
         abort(403)
     if request.method == 'POST':
@@ -173,7 +235,7 @@ def edit_post(post_id):
             flash('Title and content are required.', 'danger')
             return redirect(url_for('main.edit_post', post_id=post.id))
         post.title = title
-        post.content = content
+        post.set_content(content)
         db.session.commit()
         flash('Post updated.', 'success')
         return redirect(url_for('main.post_detail', post_id=post.id))
@@ -187,23 +249,22 @@ def delete_post(post_id):
     if post.author != current_user:
         abort(403)
 
-    # Safety: manual cascade for legacy DBs
-    Comment.query.filter_by(post_id=post.id).delete(synchronize_session=False)
-
-    db.session.delete(post)
+    # Hidden at once; app/purge.py removes its comments and likes later
+    post.soft_delete()
     db.session.commit()
     flash('Post deleted.', 'success')
     return redirect(url_for('main.dashboard'))
 
 # Post detail + comments + view count
 @main.route('/post/<int:post_id>', methods=['GET', 'POST'])
+@rate_limit('comment', ip='30/minute', user='10/minute')
+@query_budget(10)
 def post_detail(post_id):
-    post = Post.query.get_or_404(post_id)
-    # Fix NoneType error for views count
-    if post.views is None:
-        post.views = 0
-    post.views += 1
-    db.session.commit()
+    post = Post.query.options(undefer(Post.content_html)).get_or_404(post_id)
+    # Writes happen after the (read-only) request, in their own transaction
+    if post.refresh_html():
+        defer_write(Post.save_html, post.id, post.content_html, post.content_html_version)
+    defer_write(Post.count_view, post.id)
 
     # Handle new comment
     if request.method == 'POST':
@@ -225,15 +286,15 @@ def post_detail(post_id):
                 user_id=post.author.id,
                 sender_id=current_user.id,
                 notification_type='comment',
-                message=f'{current_user.username} commented on your story "{post.title}"',
-                link=url_for('main.post_detail', post_id=post.id)
+                target_id=post.id
             )
         return redirect(url_for('main.post_detail', post_id=post.id))
 
-    comments = Comment.query.filter_by(post=post).order_by(Comment.date_commented.desc()).all()
-    return render_template('post_detail.html', post=post, comments=comments)
+    comments = Comment.query.filter_by(post=post).options(joinedload(Comment.commenter)).order_by(Comment.date_commented.desc()).all()
+    return render_template('post_detail.html', post=post, comments=comments, liked_ids=viewer_liked_ids([post]))
 
 @main.route('/post/<int:post_id>/like', methods=['POST'])
+@rate_limit('like', ip='60/minute', user='30/minute')
 @login_required
 def like_post(post_id):
     post = Post.query.get_or_404(post_id)
@@ -257,15 +318,14 @@ def like_post(post_id):
                 user_id=post.author.id,
                 sender_id=current_user.id,
                 notification_type='like',
-                message=f'{current_user.username} liked your story "{post.title}"',
-                link=url_for('main.post_detail', post_id=post.id)
+                target_id=post.id
             )
     return redirect(request.referrer or url_for('main.home'))
 
 @main.route('/follow/<username>', methods=['POST'])
 @login_required
 def follow(username):
-    user = User.query.filter(func.lower(User.username) == username.lower()).first()
+    user = User.by_username(username).first()
     if user is None:
         flash(f'User {username} not found.', 'danger')
         return redirect(url_for('main.home'))
@@ -280,16 +340,14 @@ def follow(username):
     Notification.create_notification(
         user_id=user.id,
         sender_id=current_user.id,
-        notification_type='follow',
-        message=f'{current_user.username} started following you',
-        link=url_for('main.profile', username=current_user.username)
+        notification_type='follow'
     )
     return redirect(url_for('main.profile', username=username))
 
 @main.route('/unfollow/<username>', methods=['POST'])
 @login_required
 def unfollow(username):
-    user = User.query.filter(func.lower(User.username) == username.lower()).first()
+    user = User.by_username(username).first()
     if user is None:
         flash(f'User {username} not found.', 'danger')
         return redirect(url_for('main.home'))
@@ -303,32 +361,38 @@ def unfollow(username):
 
 @main.route('/feed')
 @login_required
+@query_budget(5)
 def feed():
     page = request.args.get('page', 1, type=int)
-    q = current_user.followed_posts()
-    p = paginate(q, page, per_page=5)
+    p = paginate_cards(page, listings.followed_by(current_user.id), per_page=5)
     return render_template('feed.html', posts=p['items'], p=p)
 
 @main.route('/profile/<username>/followers')
+@query_budget(6)
 def followers_list(username):
-    user = User.query.filter(func.lower(User.username) == username.lower()).first_or_404()
+    user = User.by_username(username).first_or_404()
     page = request.args.get('page', 1, type=int)
     followers_pagination = user.followers.paginate(page=page, per_page=20, error_out=False)
-    return render_template('followers.html', user=user, users=followers_pagination.items, pagination=followers_pagination)
+    following_ids = viewer_following_ids(followers_pagination.items)
+    return render_template('followers.html', user=user, users=followers_pagination.items, pagination=followers_pagination, following_ids=following_ids)
 
 @main.route('/profile/<username>/following')
+@query_budget(6)
 def following_list(username):
-    user = User.query.filter(func.lower(User.username) == username.lower()).first_or_404()
+    user = User.by_username(username).first_or_404()
     page = request.args.get('page', 1, type=int)
     following_pagination = user.followed.paginate(page=page, per_page=20, error_out=False)
-    return render_template('following.html', user=user, users=following_pagination.items, pagination=following_pagination)
+    following_ids = viewer_following_ids(following_pagination.items)
+    return render_template('following.html', user=user, users=following_pagination.items, pagination=following_pagination, following_ids=following_ids)
 
 @main.route('/notifications')
 @login_required
+@query_budget(6)
 def notifications():
     page = request.args.get('page', 1, type=int)
-    q = Notification.query.filter_by(user_id=current_user.id).order_by(Notification.created_at.desc())
+    q = Notification.for_user(current_user.id).order_by(Notification.created_at.desc())
     p = paginate(q, page, per_page=10)
+    Notification.render_all(p['items'])
     return render_template('notifications.html', notifications=p['items'], p=p)
 
 @main.route('/notifications/mark-read', methods=['POST'])
@@ -378,6 +442,7 @@ def ai_assistant():
     return render_template('ai_assistant.html')
 
 @main.route('/api/ai/continue-story', methods=['POST'])
+@rate_limit('ai', ip='20/minute', user='10/minute')
 @login_required
 def api_continue_story():
     """API endpoint to continue a story."""
@@ -393,6 +458,7 @@ def api_continue_story():
     return jsonify(result)
 
 @main.route('/api/ai/generate-starter', methods=['POST'])
+@rate_limit('ai', ip='20/minute', user='10/minute')
 @login_required
 def api_generate_starter():
     """API endpoint to generate a story starter."""
@@ -405,6 +471,7 @@ def api_generate_starter():
     return jsonify(result)
 
 @main.route('/api/ai/suggest-titles', methods=['POST'])
+@rate_limit('ai', ip='20/minute', user='10/minute')
 @login_required
 def api_suggest_titles():
     """API endpoint to suggest titles."""
@@ -419,6 +486,7 @@ def api_suggest_titles():
     return jsonify(result)
 
 @main.route('/api/ai/improve-writing', methods=['POST'])
+@rate_limit('ai', ip='20/minute', user='10/minute')
 @login_required
 def api_improve_writing():
     """API endpoint to improve writing."""
@@ -432,6 +500,7 @@ def api_improve_writing():
     return jsonify(result)
 
 @main.route('/api/ai/get-suggestions', methods=['POST'])
+@rate_limit('ai', ip='20/minute', user='10/minute')
 @login_required
 def api_get_suggestions():
     """API endpoint to get writing suggestions."""
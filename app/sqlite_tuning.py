@@ -0,0 +1,107 @@
+"""SQLite tuning profile for single-node deployments.
+
+Every new connection to a SQLite engine gets the pragmas in SQLITE_PRAGMAS.
+The defaults are:
+- WAL, so readers no longer block on the writer
+- synchronous=NORMAL, which is safe with WAL
+- a 256 MB memory map and a 64 MB page cache
+- busy_timeout, so a writer waits instead of failing
+- in-memory temp tables
+
+Periodic maintenance keeps the WAL from growing and the planner's
+statistics current. A daemon thread, started with the first request,
+runs wal_checkpoint(PASSIVE) and PRAGMA optimize every
+SQLITE_MAINTENANCE_INTERVAL seconds. `flask sqlite maintain` does the same
+with a truncating checkpoint.
+"""
+import re
+import threading
+import time
+
+from sqlalchemy import event
+
+from . import db
+
+PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+
+def sqlite_engines():
+    """Each distinct SQLite engine (binds may share one)."""
+    engines = {}
+    for engine in db.engines.values():
+        if engine.dialect.name == 'sqlite':
+            engines[id(engine)] = engine
+    return list(engines.values())
+
+
+def make_pragma_listener(pragmas):
+    statements = []
+    for name, value in pragmas.items():
+        value = str(value).strip() if value is not None else ''
+        if not value:
+            continue
+        if not PRAGMA_VALUE.match(value):
+            raise ValueError('Invalid value for SQLite pragma %s: %r' % (name, value))
+        statements.append('PRAGMA %s = %s' % (name, value))
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+    return set_pragmas
+
+
+def maintain(engine, checkpoint='PASSIVE'):
+    """Checkpoint the WAL and refresh planner statistics.
+
+    Returns the wal_checkpoint result (busy, log frames, checkpointed frames).
+    """
+    with engine.connect() as conn:
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            result = cursor.execute('PRAGMA wal_checkpoint(%s)' % checkpoint).fetchone()
+            cursor.execute('PRAGMA optimize')
+        finally:
+            cursor.close()
+    return result
+
+
+class MaintenanceThread(threading.Thread):
+    def __init__(self, app, interval):
+        super().__init__(name='sqlite-maintenance', daemon=True)
+        self.app = app
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.app.app_context():
+                for engine in sqlite_engines():
+                    try:
+                        maintain(engine)
+                    except Exception:
+                        self.app.logger.exception('SQLite maintenance failed for %s', engine.url)
+
+
+def configure_sqlite(app):
+    """Attach the pragma profile to the app's SQLite engines (in an app context)."""
+    engines = sqlite_engines()
+    if not engines:
+        return
+    listener = make_pragma_listener(app.config.get('SQLITE_PRAGMAS') or {})
+    for engine in engines:
+        event.listen(engine, 'connect', listener)
+
+    interval = app.config.get('SQLITE_MAINTENANCE_INTERVAL')
+    if interval:
+        lock = threading.Lock()
+        started = []
+
+        @app.before_request
+        def start_sqlite_maintenance():
+            if not started:
+                with lock:
+                    if not started:
+                        MaintenanceThread(app, interval).start()
+                        started.append(True)
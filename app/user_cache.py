@@ -0,0 +1,121 @@
+"""Short-lived cache behind Flask-Login's user loader.
+
+Every authenticated request starts by loading current_user. Instead of a
+primary-key SELECT each time, the columns templates read from current_user
+(username, bio) are kept in-process for USER_CACHE_TTL seconds, and the User
+is rebuilt from them as a persistent instance without touching the database.
+Anything not cached (password_hash, relationships) still loads lazily on
+first access, so current_user behaves like any other User.
+
+Entries are dropped when a User is updated or deleted (edit_profile, password
+changes, deletion), in this process. Each id has a version stamp that every
+invalidation bumps, so a load that raced with an update is not cached. Other
+worker processes see such a change once their entry expires.
+"""
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+
+from . import db
+from .models import User
+
+
+class UserCache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._records = {}   # user id -> (expires at, version, (username, bio))
+        self._versions = {}  # user id -> version stamp
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        entry = self._records.get(user_id)
+        if entry is None:
+            return None
+        expires_at, version, record = entry
+        if expires_at < time.monotonic() or version != self._versions.get(user_id, 0):
+            return None
+        return record
+
+    def version(self, user_id):
+        return self._versions.get(user_id, 0)
+
+    def put(self, user_id, record, version):
+        """Cache a record read while the id was at `version`; a no-op if it
+        has been invalidated since."""
+        with self._lock:
+            if version == self._versions.get(user_id, 0):
+                self._records[user_id] = (time.monotonic() + self.ttl, version, record)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._records.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            for user_id in self._records:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._records.clear()
+
+
+def get_cache():
+    if has_app_context():
+        return current_app.extensions.get('user_cache')
+    return None
+
+
+def load_user(user_id):
+    """Flask-Login user loader: the cached user, or one primary-key query."""
+    cache = get_cache()
+    if cache is None:
+        return db.session.get(User, user_id)
+    record = cache.get(user_id)
+    if record is not None:
+        return _attach(user_id, record)
+    version = cache.version(user_id)
+    user = db.session.get(User, user_id)
+    if user is not None:
+        cache.put(user_id, (user.username, user.bio), version)
+    return user
+
+
+def _attach(user_id, record):
+    username, bio = record
+    user = User(id=user_id, username=username, bio=bio)
+    # Give it an identity without loading; other attributes load on access
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    cache = get_cache()
+    if cache is not None:
+        cache.invalidate(target.id)
+        # Invalidate again after commit, in case another request re-cached
+        # the old row between this flush and the commit
+        db.session.info.setdefault('user_cache_invalidate', set()).add(target.id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_after_commit(session):
+    user_ids = session.info.pop('user_cache_invalidate', None)
+    cache = get_cache()
+    if user_ids and cache is not None:
+        for user_id in user_ids:
+            cache.invalidate(user_id)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop('user_cache_invalidate', None)
+
+
+def init_app(app):
+    ttl = app.config.get('USER_CACHE_TTL', 0)
+    if ttl > 0:
+        app.extensions['user_cache'] = UserCache(ttl)
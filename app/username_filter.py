@@ -0,0 +1,182 @@
+"""Bloom filter of taken usernames for the live availability check.
+
+/api/username-available answers as the user types. A Bloom filter never
+misses a name it was given, so "not in the filter" means the name is free
+and the check costs no query at all. "Maybe in the filter" falls through to
+the indexed User.by_username() lookup.
+
+The filter is filled from user.username_lower when the app starts. New users
+are added as they are inserted (mapper event). Other worker processes pick up
+each other's registrations when the filter is rebuilt every
+USERNAME_FILTER_REFRESH seconds, or sooner once it outgrows its capacity.
+Rebuilds run on a background thread, never in a request; the old filter keeps
+answering until the new one is swapped in. Until the first build succeeds
+(e.g. before the first migration) every check falls through to the database.
+The answer is only a hint: register still checks the database.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import db
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+MIN_CAPACITY = 1024
+RETRY_SECONDS = 30
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for pos in self._positions(value):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+
+
+class UsernameFilter:
+    def __init__(self, app, error_rate, refresh):
+        self.app = app
+        self.error_rate = error_rate
+        self.refresh = refresh
+        self._bloom = None
+        self._built_at = 0
+        self._tried_at = None
+        self._added = None  # names added while a rebuild is running
+        self._rebuild = None  # running rebuild thread
+        self._lock = threading.Lock()
+
+    def _stale(self, now):
+        if self._tried_at is not None and now - self._tried_at < RETRY_SECONDS:
+            return False
+        return (self._bloom is None
+                or now - self._built_at > self.refresh
+                or self._bloom.count > self._bloom.capacity)
+
+    def build(self):
+        """Build a new filter and swap it in; needs an app context."""
+        with self._lock:
+            self._added = []
+        try:
+            # Soft-deleted users keep their names until they are purged
+            total = db.session.execute(
+                select(func.count()).select_from(User).execution_options(include_deleted=True)
+            ).scalar()
+            names = db.session.execute(
+                select(User.username_lower).execution_options(yield_per=1000, include_deleted=True)
+            ).scalars()
+            # Room to grow before the error rate degrades and forces a rebuild
+            bloom = BloomFilter(max(MIN_CAPACITY, total * 2), self.error_rate)
+            for name in names:
+                bloom.add(name)
+        except SQLAlchemyError as exc:
+            db.session.rollback()
+            with self._lock:
+                self._added = None
+                self._tried_at = time.monotonic()
+            logger.warning('Could not build the username filter, checking the database instead: %s', exc)
+            return False
+        with self._lock:
+            # Registrations that committed after the scan started
+            for name in self._added:
+                bloom.add(name)
+            self._added = None
+            self._bloom = bloom
+            self._built_at = time.monotonic()
+            self._tried_at = None
+        return True
+
+    def _run_rebuild(self):
+        try:
+            with self.app.app_context():
+                self.build()
+        finally:
+            with self._lock:
+                self._rebuild = None
+
+    def rebuild(self, wait=False):
+        """Rebuild on a background thread; wait=True blocks until it is done."""
+        with self._lock:
+            thread = self._rebuild
+            if thread is None:
+                thread = threading.Thread(target=self._run_rebuild, name='username-filter', daemon=True)
+                self._rebuild = thread
+                thread.start()
+        if wait:
+            thread.join()
+
+    def might_exist(self, username):
+        if self._stale(time.monotonic()):
+            self.rebuild()
+        bloom = self._bloom
+        return bloom is None or username.lower() in bloom
+
+    def add(self, username):
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(username.lower())
+            if self._added is not None:
+                self._added.append(username.lower())
+
+
+def get_filter():
+    if has_app_context():
+        return current_app.extensions.get('username_filter')
+    return None
+
+
+def is_username_available(username):
+    """True if no user has this name (case-insensitive)."""
+    username_filter = get_filter()
+    if username_filter is not None and not username_filter.might_exist(username):
+        return True
+    return User.by_username(username, include_deleted=True).first() is None
+
+
+@event.listens_for(User, 'after_insert')
+def _remember_username(mapper, connection, target):
+    # A rolled-back insert leaves a false positive, which only costs a lookup
+    username_filter = get_filter()
+    if username_filter is not None:
+        username_filter.add(target.username)
+
+
+@event.listens_for(User, 'after_update')
+def _remember_renamed_username(mapper, connection, target):
+    if db.inspect(target).attrs.username.history.has_changes():
+        _remember_username(mapper, connection, target)
+
+
+def init_app(app):
+    if app.config.get('USERNAME_FILTER_ENABLED'):
+        username_filter = UsernameFilter(
+            app,
+            app.config['USERNAME_FILTER_ERROR_RATE'],
+            app.config['USERNAME_FILTER_REFRESH'],
+        )
+        app.extensions['username_filter'] = username_filter
+        with app.app_context():
+            username_filter.build()
@@ -0,0 +1,91 @@
+"""Compare the ORM listing path with the column-projection read path.
+
+Seeds a throwaway SQLite database with long stories and measures, per
+simulated listing request, peak Python memory and rows fetched per second.
+
+    python benchmarks/bench_listing.py [--posts 2000] [--per-page 50] [--rounds 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy.orm import joinedload, undefer  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app.config import Config  # noqa: E402
+
+STORY = 'একদিন এক গ্রামে এক বুড়ো মাঝি থাকত। ' * 600  # ~20 KB of Bengali text
+
+
+def make_app(path):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+        ACTIVITY_DATABASE_URL = ''
+    return create_app(BenchConfig)
+
+
+def seed(posts):
+    from app.models import User, Post
+    users = [User(username='writer%d' % i, password_hash='x') for i in range(20)]
+    db.session.add_all(users)
+    db.session.flush()
+    for i in range(posts):
+        post = Post(title='Story %d' % i, category='Fiction', author=users[i % 20], likes=0, views=0)
+        post.set_content(STORY)
+        db.session.add(post)
+    db.session.commit()
+
+
+def orm_page(per_page):
+    from app.models import Post
+    posts = Post.query.options(joinedload(Post.author), undefer(Post.content)).order_by(Post.date_posted.desc()).limit(per_page).all()
+    # Touch what a card renders
+    return [(p.id, p.title, p.author.username, p.content[:300], p.likes, p.views) for p in posts]
+
+
+def projection_page(per_page):
+    from app import listings
+    cards = listings.fetch_cards(limit=per_page)
+    return [(c.id, c.title, c.author_username, c.excerpt, c.likes, c.views) for c in cards]
+
+
+def measure(name, fn, per_page, rounds):
+    db.session.remove()
+    tracemalloc.start()
+    fn(per_page)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    db.session.remove()
+
+    rows = 0
+    started = time.perf_counter()
+    for _ in range(rounds):
+        rows += len(fn(per_page))
+        db.session.remove()
+    elapsed = time.perf_counter() - started
+    print('%-12s peak memory/request: %8.1f KiB   rows/s: %10.0f' % (name, peak / 1024.0, rows / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--per-page', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+            seed(args.posts)
+            measure('orm', orm_page, args.per_page, args.rounds)
+            measure('projection', projection_page, args.per_page, args.rounds)
+
+
+if __name__ == '__main__':
+    main()
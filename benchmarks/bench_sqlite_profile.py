@@ -0,0 +1,134 @@
+"""Compare read/write concurrency under SQLite's defaults and the tuned profile.
+
+For each profile, seeds a throwaway database, then runs reader threads
+(listing pages) alongside writer threads (comments) for a fixed time and
+reports throughput, read latency and "database is locked" errors.
+
+    python benchmarks/bench_sqlite_profile.py [--readers 8] [--writers 2] [--seconds 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app.config import Config  # noqa: E402
+
+PROFILES = {
+    # Rollback journal with SQLite's defaults, as before the tuning profile
+    'default': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'tuned': Config.SQLITE_PRAGMAS,
+}
+
+
+def make_app(path, pragmas):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+        ACTIVITY_DATABASE_URL = ''
+        SQLITE_PRAGMAS = pragmas
+        SQLITE_MAINTENANCE_INTERVAL = 0
+    return create_app(BenchConfig)
+
+
+def seed(posts):
+    from app.models import User, Post
+    users = [User(username='writer%d' % i, password_hash='x') for i in range(20)]
+    db.session.add_all(users)
+    db.session.flush()
+    for i in range(posts):
+        post = Post(title='Story %d' % i, category='Fiction', author=users[i % 20], likes=0, views=0)
+        post.set_content('Once upon a time. ' * 200)
+        db.session.add(post)
+    db.session.commit()
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reads = []  # latencies in seconds
+        self.writes = 0
+        self.errors = 0
+
+
+def reader(app, stats, deadline):
+    from app import listings
+    while time.perf_counter() < deadline:
+        with app.app_context():
+            started = time.perf_counter()
+            try:
+                listings.count_posts()
+                listings.fetch_cards(limit=20)
+            except OperationalError:
+                with stats.lock:
+                    stats.errors += 1
+                continue
+            finally:
+                db.session.remove()
+            with stats.lock:
+                stats.reads.append(time.perf_counter() - started)
+
+
+def writer(app, stats, deadline, user_id):
+    from app.models import Comment
+    i = 0
+    while time.perf_counter() < deadline:
+        i += 1
+        with app.app_context():
+            try:
+                db.session.add(Comment(content='Comment %d' % i, post_id=1 + i % 100, user_id=user_id))
+                db.session.commit()
+            except OperationalError:
+                db.session.rollback()
+                with stats.lock:
+                    stats.errors += 1
+                continue
+            finally:
+                db.session.remove()
+            with stats.lock:
+                stats.writes += 1
+
+
+def run(name, pragmas, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'), pragmas)
+        with app.app_context():
+            db.create_all()
+            seed(args.posts)
+            db.session.remove()
+
+        stats = Stats()
+        deadline = time.perf_counter() + args.seconds
+        threads = [threading.Thread(target=reader, args=(app, stats, deadline)) for _ in range(args.readers)]
+        threads += [threading.Thread(target=writer, args=(app, stats, deadline, 1 + n % 20)) for n in range(args.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with app.app_context():
+            db.engine.dispose()
+
+    reads = sorted(stats.reads)
+    p95 = reads[int(len(reads) * 0.95)] * 1000 if reads else 0
+    print('%-8s reads/s: %8.0f   p95 read: %7.1f ms   writes/s: %7.0f   locked errors: %d' % (
+        name, len(reads) / args.seconds, p95, stats.writes / args.seconds, stats.errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+    for name, pragmas in PROFILES.items():
+        run(name, pragmas, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -47,7 +47,13 @@ target_db = current_app.extensions['migrate'].db
 
 def get_metadata():
     if hasattr(target_db, 'metadatas'):
-        return target_db.metadatas[None]
+        metadatas = [target_db.metadatas[None]]
+        # Activity tables are migrated with the main database unless
+        # ACTIVITY_DATABASE_URL moved them to their own database.
+        if 'activity' in target_db.metadatas and \
+                target_db.engines['activity'] is target_db.engines[None]:
+            metadatas.append(target_db.metadatas['activity'])
+        return metadatas
     return target_db.metadata
 
 
@@ -90,9 +96,20 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # Activity tables have no foreign keys in the models (they may live in a
+    # separate database), but keep the ON DELETE CASCADE constraints that
+    # already exist when they share the main database.
+    def include_object(object, name, type_, reflected, compare_to):
+        if type_ == 'foreign_key_constraint' and reflected and compare_to is None:
+            activity = target_db.metadatas.get('activity') if hasattr(target_db, 'metadatas') else None
+            return activity is None or object.table.name not in activity.tables
+        return True
+
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_object") is None:
+        conf_args["include_object"] = include_object
 
     connectable = get_engine()
 
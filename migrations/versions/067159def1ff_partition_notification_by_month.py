@@ -0,0 +1,81 @@
+"""Partition notification by month (PostgreSQL, opt-in)
+
+Converts `notification` into a table partitioned by RANGE (created_at) when
+NOTIFICATION_PARTITIONING is enabled and the database is PostgreSQL. On any
+other setup this revision is a no-op.
+
+Revision ID: 067159def1ff
+Revises: 6e95d3e6b29b
+Create Date: 2026-10-18 23:52:10.418266
+
+"""
+from datetime import datetime
+
+from alembic import op
+from flask import current_app
+import sqlalchemy as sa
+
+from app import partitions
+
+
+# revision identifiers, used by Alembic.
+revision = '067159def1ff'
+down_revision = '6e95d3e6b29b'
+branch_labels = None
+depends_on = None
+
+COLUMNS = 'id, user_id, sender_id, type_code, target_id, params, is_read, created_at'
+
+TABLE_BODY = """
+    id INTEGER NOT NULL DEFAULT nextval('notification_id_seq'),
+    user_id INTEGER NOT NULL REFERENCES "user" (id) ON DELETE CASCADE,
+    sender_id INTEGER REFERENCES "user" (id) ON DELETE CASCADE,
+    type_code SMALLINT NOT NULL,
+    target_id INTEGER,
+    params VARCHAR(64),
+    is_read BOOLEAN NOT NULL DEFAULT false,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+"""
+
+
+def _enabled(conn):
+    return partitions.is_postgres(conn) and current_app.config.get('NOTIFICATION_PARTITIONING')
+
+
+def upgrade():
+    conn = op.get_bind()
+    if not _enabled(conn) or partitions.is_partitioned(conn):
+        return
+
+    op.execute('ALTER TABLE notification RENAME TO notification_unpartitioned')
+    op.execute('ALTER TABLE notification_unpartitioned RENAME CONSTRAINT notification_pkey TO notification_unpartitioned_pkey')
+    op.execute('ALTER SEQUENCE notification_id_seq OWNED BY NONE')
+    # The partition key must be part of the primary key
+    op.execute('CREATE TABLE notification (%s, PRIMARY KEY (id, created_at)) PARTITION BY RANGE (created_at)' % TABLE_BODY)
+    partitions.create_default_partition(conn)
+
+    oldest = conn.execute(sa.text('SELECT min(created_at) FROM notification_unpartitioned')).scalar()
+    now = datetime.utcnow()
+    partitions.create_partitions(
+        conn,
+        partitions.month_start(oldest or now),
+        partitions.add_months(partitions.month_start(now), current_app.config.get('NOTIFICATION_PARTITIONS_AHEAD', 3)),
+    )
+
+    op.execute('INSERT INTO notification (%s) SELECT %s FROM notification_unpartitioned' % (COLUMNS, COLUMNS))
+    op.execute('DROP TABLE notification_unpartitioned')
+    op.execute('ALTER SEQUENCE notification_id_seq OWNED BY notification.id')
+
+
+def downgrade():
+    conn = op.get_bind()
+    if not partitions.is_partitioned(conn):
+        return
+
+    op.execute('ALTER TABLE notification RENAME TO notification_partitioned')
+    op.execute('ALTER TABLE notification_partitioned RENAME CONSTRAINT notification_pkey TO notification_partitioned_pkey')
+    op.execute('ALTER SEQUENCE notification_id_seq OWNED BY NONE')
+    op.execute('CREATE TABLE notification (%s, PRIMARY KEY (id))' % TABLE_BODY)
+    op.execute('INSERT INTO notification (%s) SELECT %s FROM notification_partitioned' % (COLUMNS, COLUMNS))
+    op.execute('DROP TABLE notification_partitioned')
+    op.execute('ALTER SEQUENCE notification_id_seq OWNED BY notification.id')
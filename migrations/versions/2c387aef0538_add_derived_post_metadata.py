@@ -0,0 +1,36 @@
+"""Add derived post metadata columns
+
+Columns start out NULL for existing posts; the post_derived backfill
+(`flask backfill run post_derived`) fills them in batches without holding a
+long lock.
+
+Revision ID: 2c387aef0538
+Revises: 993d5d7533f1
+Create Date: 2026-10-19 00:52:03.117409
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c387aef0538'
+down_revision = '993d5d7533f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('post') as batch_op:
+        batch_op.add_column(sa.Column('word_count', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('char_count', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('reading_time', sa.SmallInteger(), nullable=True))
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('post') as batch_op:
+        batch_op.drop_column('content_hash')
+        batch_op.drop_column('reading_time')
+        batch_op.drop_column('char_count')
+        batch_op.drop_column('word_count')
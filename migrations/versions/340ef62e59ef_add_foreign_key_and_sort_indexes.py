@@ -0,0 +1,70 @@
+"""Add foreign-key and sort indexes
+
+Indexes matching the listing, comment, follower and notification queries.
+On PostgreSQL they are built CONCURRENTLY (outside a transaction) so the
+tables stay writable; a partitioned notification parent does not support
+that and gets a plain CREATE INDEX, which cascades to its partitions.
+Activity tables that live in a separate database are skipped here; they get
+their indexes from db.create_all().
+
+Revision ID: 340ef62e59ef
+Revises: 799d7acfcec8
+Create Date: 2026-10-19 02:14:51.276309
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app import partitions
+
+
+# revision identifiers, used by Alembic.
+revision = '340ef62e59ef'
+down_revision = '799d7acfcec8'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns, extra keyword arguments)
+INDEXES = [
+    ('ix_post_user_id_date_posted', 'post', ['user_id', 'date_posted'], {}),
+    ('ix_post_date_posted', 'post', ['date_posted'], {}),
+    ('ix_comment_post_id_date_commented', 'comment', ['post_id', 'date_commented'], {}),
+    ('ix_comment_user_id', 'comment', ['user_id'], {}),
+    ('ix_followers_followed_id', 'followers', ['followed_id'], {}),
+    ('ix_like_post_id', 'like', ['post_id'], {}),
+    ('ix_notification_user_id_created_at', 'notification', ['user_id', 'created_at'], {}),
+    ('ix_notification_unread', 'notification', ['user_id', 'created_at'], {
+        'postgresql_where': sa.text('is_read = false'),
+        'sqlite_where': sa.text('is_read = 0'),
+    }),
+]
+
+
+def _indexes(conn):
+    tables = set(sa.inspect(conn).get_table_names())
+    partitioned = partitions.is_partitioned(conn)
+    for name, table, columns, kwargs in INDEXES:
+        if table in tables:
+            concurrently = partitions.is_postgres(conn) and not (table == 'notification' and partitioned)
+            yield name, table, columns, kwargs, concurrently
+
+
+def upgrade():
+    conn = op.get_bind()
+    indexes = list(_indexes(conn))
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs, concurrently in indexes:
+            if concurrently:
+                kwargs = dict(kwargs, postgresql_concurrently=True)
+            op.create_index(name, table, columns, unique=False, **kwargs)
+
+
+def downgrade():
+    conn = op.get_bind()
+    indexes = list(_indexes(conn))
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs, concurrently in reversed(indexes):
+            if concurrently:
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
+            else:
+                op.drop_index(name, table_name=table)
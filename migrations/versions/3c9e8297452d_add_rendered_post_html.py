@@ -0,0 +1,31 @@
+"""Add rendered post HTML
+
+Existing posts start without stored HTML and are rendered the first time
+they are viewed.
+
+Revision ID: 3c9e8297452d
+Revises: 2c387aef0538
+Create Date: 2026-10-19 01:14:37.660215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9e8297452d'
+down_revision = '2c387aef0538'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('post') as batch_op:
+        batch_op.add_column(sa.Column('content_html', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('content_html_version', sa.SmallInteger(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('post') as batch_op:
+        batch_op.drop_column('content_html_version')
+        batch_op.drop_column('content_html')
@@ -0,0 +1,116 @@
+"""Compact notification storage
+
+Replace the rendered message/link/notification_type strings with a small
+type code, a target id and optional params. Text is rendered at read time.
+
+Revision ID: 6e95d3e6b29b
+Revises: 4000b41ed147
+Create Date: 2026-10-18 23:38:27.547343
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e95d3e6b29b'
+down_revision = '4000b41ed147'
+branch_labels = None
+depends_on = None
+
+TYPE_CODES = {'like': 1, 'comment': 2, 'follow': 3, 'new_post': 4}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+MESSAGES = {
+    'like': '{actor} liked your story "{title}"',
+    'comment': '{actor} commented on your story "{title}"',
+    'follow': '{actor} started following you',
+    'new_post': '{actor} published a new story "{title}"',
+}
+POST_LINK = re.compile(r'/post/(\d+)')
+BATCH_SIZE = 1000
+
+notification = sa.table(
+    'notification',
+    sa.column('id', sa.Integer),
+    sa.column('sender_id', sa.Integer),
+    sa.column('notification_type', sa.String),
+    sa.column('message', sa.String),
+    sa.column('link', sa.String),
+    sa.column('type_code', sa.SmallInteger),
+    sa.column('target_id', sa.Integer),
+)
+
+
+def _batches(conn, columns):
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(notification.c.id, *columns)
+            .where(notification.c.id > last_id)
+            .order_by(notification.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def upgrade():
+    with op.batch_alter_table('notification') as batch_op:
+        batch_op.add_column(sa.Column('type_code', sa.SmallInteger(), nullable=True))
+        batch_op.add_column(sa.Column('target_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('params', sa.String(length=64), nullable=True))
+
+    conn = op.get_bind()
+    for rows in _batches(conn, [notification.c.notification_type, notification.c.link]):
+        for row_id, notification_type, link in rows:
+            match = POST_LINK.search(link or '')
+            conn.execute(
+                notification.update()
+                .where(notification.c.id == row_id)
+                .values(
+                    type_code=TYPE_CODES.get(notification_type, 0),
+                    target_id=int(match.group(1)) if match else None,
+                )
+            )
+
+    with op.batch_alter_table('notification') as batch_op:
+        batch_op.alter_column('type_code', existing_type=sa.SmallInteger(), nullable=False)
+        batch_op.drop_column('message')
+        batch_op.drop_column('link')
+        batch_op.drop_column('notification_type')
+
+
+def downgrade():
+    with op.batch_alter_table('notification') as batch_op:
+        batch_op.add_column(sa.Column('notification_type', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('message', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('link', sa.String(length=255), nullable=True))
+
+    conn = op.get_bind()
+    names = dict(conn.execute(sa.text('SELECT id, username FROM "user"')).fetchall())
+    titles = dict(conn.execute(sa.text('SELECT id, title FROM post')).fetchall())
+    for rows in _batches(conn, [notification.c.sender_id, notification.c.type_code, notification.c.target_id]):
+        for row_id, sender_id, type_code, target_id in rows:
+            name = TYPE_NAMES.get(type_code, 'follow')
+            actor = names.get(sender_id, 'Someone')
+            if name == 'follow':
+                link = '/profile/%s' % actor
+            else:
+                link = '/post/%d' % target_id if target_id else None
+            message = MESSAGES[name].format(actor=actor, title=titles.get(target_id, ''))
+            conn.execute(
+                notification.update()
+                .where(notification.c.id == row_id)
+                .values(notification_type=name, message=message[:255], link=link)
+            )
+
+    with op.batch_alter_table('notification') as batch_op:
+        batch_op.alter_column('notification_type', existing_type=sa.String(length=20), nullable=False)
+        batch_op.alter_column('message', existing_type=sa.String(length=255), nullable=False)
+        batch_op.drop_column('params')
+        batch_op.drop_column('target_id')
+        batch_op.drop_column('type_code')
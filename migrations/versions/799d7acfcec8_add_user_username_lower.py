@@ -0,0 +1,57 @@
+"""Add indexed user.username_lower for case-insensitive lookups
+
+Revision ID: 799d7acfcec8
+Revises: 3c9e8297452d
+Create Date: 2026-10-19 01:47:26.530811
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '799d7acfcec8'
+down_revision = '3c9e8297452d'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+user = sa.table(
+    'user',
+    sa.column('id', sa.Integer),
+    sa.column('username', sa.String),
+    sa.column('username_lower', sa.String),
+)
+
+
+def upgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.add_column(sa.Column('username_lower', sa.String(length=64), nullable=True))
+
+    # Lowercase in Python, as User.by_username() does; SQLite's lower() only
+    # folds ASCII.
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(user.c.id, user.c.username)
+            .where(user.c.id > last_id)
+            .order_by(user.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        for user_id, username in rows:
+            conn.execute(user.update().where(user.c.id == user_id).values(username_lower=username.lower()))
+        last_id = rows[-1][0]
+
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.alter_column('username_lower', existing_type=sa.String(length=64), nullable=False)
+        batch_op.create_index('ix_user_username_lower', ['username_lower'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_index('ix_user_username_lower')
+        batch_op.drop_column('username_lower')
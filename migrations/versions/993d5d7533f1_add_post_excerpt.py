@@ -0,0 +1,30 @@
+"""Add stored post excerpt
+
+Schema only: existing posts keep a NULL excerpt, which listing cards fill
+in from the content until the post_derived backfill (queued by
+e8a35c1f6b20, run with `flask backfill run`) stores it.
+
+Revision ID: 993d5d7533f1
+Revises: 067159def1ff
+Create Date: 2026-10-19 00:31:44.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '993d5d7533f1'
+down_revision = '067159def1ff'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('post') as batch_op:
+        batch_op.add_column(sa.Column('excerpt', sa.String(length=300), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('post') as batch_op:
+        batch_op.drop_column('excerpt')
@@ -0,0 +1,49 @@
+"""Add soft-delete columns to post and user
+
+Nullable deleted_at columns (no table rewrite, no backfill) with partial
+indexes over the few deleted rows, which the purge job scans. On PostgreSQL
+the indexes are built CONCURRENTLY so the tables stay writable.
+
+Revision ID: b51e07c2d9a4
+Revises: 340ef62e59ef
+Create Date: 2026-10-19 03:41:07.518224
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app import partitions
+
+
+# revision identifiers, used by Alembic.
+revision = 'b51e07c2d9a4'
+down_revision = '340ef62e59ef'
+branch_labels = None
+depends_on = None
+
+INDEXES = [('ix_post_deleted', 'post'), ('ix_user_deleted', 'user')]
+
+
+def upgrade():
+    for table in ('post', 'user'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+    concurrently = partitions.is_postgres(op.get_bind())
+    with op.get_context().autocommit_block():
+        for name, table in INDEXES:
+            op.create_index(name, table, ['deleted_at'], unique=False,
+                            postgresql_where=sa.text('deleted_at IS NOT NULL'),
+                            sqlite_where=sa.text('deleted_at IS NOT NULL'),
+                            postgresql_concurrently=concurrently)
+
+
+def downgrade():
+    concurrently = partitions.is_postgres(op.get_bind())
+    with op.get_context().autocommit_block():
+        for name, table in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=concurrently)
+
+    for table in ('user', 'post'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('deleted_at')
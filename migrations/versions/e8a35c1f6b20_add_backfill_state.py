@@ -0,0 +1,53 @@
+"""Add backfill_state for batched backfills
+
+Also queues the post_derived backfill: 2c387aef0538 left the derived post
+columns NULL on existing posts. `flask backfill run` fills them in while the
+site is up.
+
+Revision ID: e8a35c1f6b20
+Revises: b51e07c2d9a4
+Create Date: 2026-10-19 04:26:39.804512
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8a35c1f6b20'
+down_revision = 'b51e07c2d9a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('backfill_state',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('last_id', sa.Integer(), nullable=False),
+    sa.Column('rows_scanned', sa.Integer(), nullable=False),
+    sa.Column('rows_changed', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # Written directly, not through app.backfill, so later changes to the
+    # job registry cannot break this migration
+    backfill_state = sa.table(
+        'backfill_state',
+        sa.column('name', sa.String), sa.column('status', sa.String),
+        sa.column('last_id', sa.Integer), sa.column('rows_scanned', sa.Integer),
+        sa.column('rows_changed', sa.Integer), sa.column('created_at', sa.DateTime),
+    )
+    op.bulk_insert(backfill_state, [{
+        'name': 'post_derived', 'status': 'pending', 'last_id': 0,
+        'rows_scanned': 0, 'rows_changed': 0, 'created_at': datetime.utcnow(),
+    }])
+
+
+def downgrade():
+    op.drop_table('backfill_state')
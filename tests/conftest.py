@@ -0,0 +1,178 @@
+"""Shared fixtures: a seeded SQLite database, test clients and SQL counting."""
+import os
+import shutil
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import create_app, db
+from app.config import Config
+
+PASSWORD = 'password'
+
+
+class SQLCounter:
+    """Counts statements executed and rows fetched while active."""
+
+    def __init__(self):
+        self.active = False
+        self.statements = []
+        self.rows = 0
+
+    @contextmanager
+    def count(self):
+        self.statements = []
+        self.rows = 0
+        self.active = True
+        try:
+            yield self
+        finally:
+            self.active = False
+
+    def add_rows(self, n):
+        if self.active:
+            self.rows += n
+
+
+counter = SQLCounter()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if counter.active:
+        counter.statements.append(statement)
+
+
+class CountingCursor(sqlite3.Cursor):
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            counter.add_rows(1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = super().fetchmany(*args, **kwargs)
+        counter.add_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        counter.add_rows(len(rows))
+        return rows
+
+
+class CountingConnection(sqlite3.Connection):
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+
+class TestConfig(Config):
+    TESTING = True
+    SECRET_KEY = 'test-secret-key'
+    BCRYPT_LOG_ROUNDS = 4
+    QUERY_BUDGET_STRICT = True
+    SQLITE_MAINTENANCE_INTERVAL = 0
+    PURGE_INTERVAL = 0
+    SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'factory': CountingConnection}}
+
+
+def make_app(path, **config):
+    class AppConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+        ACTIVITY_DATABASE_URL = ''
+    for key, value in config.items():
+        setattr(AppConfig, key, value)
+    return create_app(AppConfig)
+
+
+def seed(app):
+    """A small but realistic site: several authors with many posts, a busy
+    post with comments and likes, follows and a notification backlog.
+
+    alice (user 1) writes post 1, the busy one. Counts are large enough that a
+    per-row query or an unbounded fetch shows up in the budgets.
+    """
+    from app.models import Comment, Like, Notification, Post, User, NOTIFICATION_CODES
+
+    with app.app_context():
+        db.create_all()
+        names = ['alice', 'bob', 'carol', 'dave', 'erin', 'frank',
+                 'grace', 'heidi', 'ivan', 'judy', 'mallory', 'oscar']
+        users = []
+        for name in names:
+            user = User(username=name, bio='Hi, I am %s.' % name)
+            user.set_password(PASSWORD)
+            users.append(user)
+        db.session.add_all(users)
+        db.session.flush()
+
+        start = datetime.utcnow() - timedelta(days=60)
+        posts = []
+        for i in range(6):
+            for author in users:
+                post = Post(title='%s story %d' % (author.username, i), category='Fiction',
+                            author=author, date_posted=start + timedelta(hours=len(posts)))
+                post.set_content(('Paragraph %d of a story by %s. ' % (i, author.username)) * 40)
+                posts.append(post)
+        db.session.add_all(posts)
+        db.session.flush()
+
+        busy = posts[0]
+        for i, user in enumerate(users * 2):
+            db.session.add(Comment(content='Comment %d' % i, post=busy, commenter=user))
+        for user in users[1:]:
+            db.session.add(Like(user_id=user.id, post_id=busy.id))
+            for post in posts[1:4]:
+                db.session.add(Like(user_id=user.id, post_id=post.id))
+        busy.likes = len(users) - 1
+
+        alice = users[0]
+        for user in users[1:]:
+            user.followed.append(alice)
+            alice.followed.append(user)
+
+        for i in range(30):
+            db.session.add(Notification(
+                user_id=alice.id, sender_id=users[1 + i % 11].id,
+                type_code=NOTIFICATION_CODES['comment' if i % 2 else 'like'],
+                target_id=busy.id, is_read=i >= 10,
+            ))
+        db.session.commit()
+        # Close the pool so the WAL is checkpointed into the file we copy
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture(scope='session')
+def seeded_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('seed') / 'site.db')
+    seed(make_app(path))
+    return path
+
+
+@pytest.fixture
+def app(seeded_db, tmp_path, monkeypatch):
+    # Keep the AI routes from calling out to the real service
+    monkeypatch.setattr('app.ai_helper.model', None)
+    path = str(tmp_path / 'site.db')
+    shutil.copyfile(seeded_db, path)
+    return make_app(path)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def sql():
+    return counter
+
+
+def login(client, username):
+    response = client.post('/login', data={'username': username, 'password': PASSWORD})
+    assert response.status_code == 302, 'login as %s failed' % username
@@ -0,0 +1,41 @@
+"""Moving likes and notifications into a separate activity database."""
+import logging
+
+from sqlalchemy import func, select
+
+from app import db
+from app.models import Like, Notification
+from tests.conftest import make_app
+
+
+def count(engine, model):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(model.__table__)).scalar()
+
+
+def test_activity_migrate_moves_rows(app, tmp_path, caplog):
+    with app.app_context():
+        likes, notifications = Like.query.count(), Notification.query.count()
+        path = app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+        db.engine.dispose()
+
+    activity_url = 'sqlite:///' + str(tmp_path / 'activity.db')
+    with caplog.at_level(logging.WARNING):
+        split = make_app(path, ACTIVITY_DATABASE_URL=activity_url)
+    assert 'flask activity migrate' in caplog.text
+
+    result = split.test_cli_runner().invoke(args=['activity', 'migrate', '--batch-size', '7'])
+    assert result.exit_code == 0, result.output
+    with split.app_context():
+        assert count(db.engines['activity'], Like) == likes
+        assert count(db.engines['activity'], Notification) == notifications
+        assert count(db.engines[None], Like) == count(db.engines[None], Notification) == 0
+
+    # Re-running copies nothing twice
+    result = split.test_cli_runner().invoke(args=['activity', 'migrate'])
+    assert 'copied 0 row(s)' in result.output
+
+    caplog.clear()
+    with caplog.at_level(logging.WARNING):
+        make_app(path, ACTIVITY_DATABASE_URL=activity_url)
+    assert 'flask activity migrate' not in caplog.text
@@ -0,0 +1,114 @@
+"""Resumable, throttled batched backfills."""
+import pytest
+from sqlalchemy import update
+
+from app import backfill, db
+from app.models import BackfillState, Post, User
+
+RUN = dict(batch_size=10, max_batch_size=40, target_batch_ms=1000, duty_cycle=1)
+
+
+def clear_derived(app):
+    with app.app_context(), db.engine.begin() as conn:
+        conn.execute(update(Post.__table__).values(content_hash=None, word_count=None, reading_time=None))
+        backfill.enqueue(conn, 'post_derived')
+
+
+def test_job_resumes_after_its_time_budget(app):
+    clear_derived(app)
+    with app.app_context():
+        assert backfill.run_job(db.engine, 'post_derived', time_budget=0, **RUN) == 'paused'
+        assert db.session.get(BackfillState, 'post_derived').last_id == 0
+
+        batches = []
+        status = backfill.run_job(db.engine, 'post_derived', report=lambda *args: batches.append(args), **RUN)
+        assert status == 'done'
+        assert [args[3] for args in batches][:2] == [10, 15]  # fast batches grow
+        assert sum(args[2] for args in batches) == 72
+
+        state = db.session.get(BackfillState, 'post_derived')
+        assert (state.status, state.last_id, state.rows_changed) == ('done', 72, 72)
+        assert Post.query.filter(Post.content_hash.is_(None)).count() == 0
+        assert db.session.get(Post, 1).reading_time >= 1
+
+
+def test_username_lower_job_only_changes_stale_rows(app):
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(update(User.__table__).where(User.__table__.c.id == 3).values(username_lower='stale'))
+        assert backfill.run_job(db.engine, 'username_lower', **RUN) == 'done'
+        state = db.session.get(BackfillState, 'username_lower')
+        assert (state.rows_scanned, state.rows_changed) == (12, 1)
+        assert User.by_username('carol').one().id == 3
+
+
+def test_require_done_blocks_contract_migrations(app):
+    with app.app_context(), db.engine.begin() as conn:
+        # Nothing left to do (every seeded post has metadata): marked done without running
+        backfill.require_done(conn, 'post_derived')
+        assert backfill.get_state(conn, 'post_derived').status == 'done'
+
+    clear_derived(app)
+    with app.app_context(), db.engine.begin() as conn:
+        assert backfill.pending_jobs(conn) == ['post_derived']
+        with pytest.raises(RuntimeError, match='flask backfill run post_derived'):
+            backfill.require_done(conn, 'post_derived')
+
+
+def test_failed_batch_is_recorded(app, monkeypatch):
+    clear_derived(app)
+    monkeypatch.setattr(backfill.JOBS['post_derived'], 'process', lambda rows: 1 / 0)
+    with app.app_context():
+        with pytest.raises(ZeroDivisionError):
+            backfill.run_job(db.engine, 'post_derived', **RUN)
+        state = db.session.get(BackfillState, 'post_derived')
+        assert state.status == 'failed' and 'ZeroDivisionError' in state.error
+        assert state.last_id == 0
+
+
+def test_batch_size_follows_measured_duration():
+    assert backfill.next_batch_size(100, 500, 200, 1000) == 50
+    assert backfill.next_batch_size(100, 50, 200, 1000) == 150
+    assert backfill.next_batch_size(100, 150, 200, 1000) == 100
+    assert backfill.next_batch_size(900, 10, 200, 1000) == 1000
+    assert backfill.next_batch_size(12, 900, 200, 1000) == backfill.MIN_BATCH_SIZE
+
+
+def test_interrupted_run_is_left_paused(app, monkeypatch):
+    clear_derived(app)
+
+    def interrupt(rows):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(backfill.JOBS['post_derived'], 'process', interrupt)
+    with app.app_context():
+        with pytest.raises(KeyboardInterrupt):
+            backfill.run_job(db.engine, 'post_derived', **RUN)
+        assert db.session.get(BackfillState, 'post_derived').status == 'paused'
+
+
+def test_require_done_tolerates_unregistered_jobs(app):
+    with app.app_context(), db.engine.begin() as conn:
+        backfill.require_done(conn, 'retired_job')
+        backfill.enqueue(conn, 'username_lower')
+        conn.execute(update(BackfillState.__table__).values(name='retired_job'))
+        with pytest.raises(RuntimeError, match='has not finished'):
+            backfill.require_done(conn, 'retired_job')
+
+
+def test_cards_fall_back_until_the_excerpt_is_backfilled(app, client):
+    clear_derived(app)
+    with app.app_context(), db.engine.begin() as conn:
+        conn.execute(update(Post.__table__).values(excerpt=None))
+    assert 'Paragraph 5 of a story by oscar.' in client.get('/').get_data(as_text=True)
+
+    with app.app_context():
+        assert backfill.run_job(db.engine, 'post_derived', **RUN) == 'done'
+        assert db.session.get(Post, 72).excerpt.startswith('Paragraph 5 of a story by oscar.')
+
+
+def test_posts_derive_runs_the_backfill_job(app):
+    clear_derived(app)
+    result = app.test_cli_runner().invoke(args=['posts', 'derive', '--batch-size', '50'])
+    assert result.exit_code == 0 and 'post_derived: done' in result.output
+    with app.app_context():
+        assert db.session.get(BackfillState, 'post_derived').rows_changed == 72
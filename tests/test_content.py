@@ -0,0 +1,29 @@
+"""Story HTML rendering and the allowlist sanitizer."""
+import pytest
+
+from app.content import render_content_html, sanitize_html
+
+
+@pytest.mark.parametrize('markup, expected', [
+    ('<p>a</p><script>alert(1)</script><p>b</p>', '<p>a</p><p>b</p>'),
+    ('<style>p { color: red }</style><p>b</p>', '<p>b</p>'),
+    # An unclosed raw-text element does not swallow the rest of the story
+    ('<p>Intro</p><script>x<p>Long story</p>', '<p>Intro</p>x<p>Long story</p>'),
+    ('<script>a<style>b</style>c', 'ac'),
+    # Markup inside a dropped element never reaches the output
+    ('<script>"</p><b>"</script>q', 'q'),
+    # Other disallowed tags lose their markup but keep their text, closed or not
+    ('<title>Title<p>Body</p>', 'Title<p>Body</p>'),
+    ('<select><option>One</select><p>k</p>', 'One<p>k</p>'),
+    ('<svg><script>bad()</script>hi</svg><p>x', 'hi<p>x</p>'),
+    ('<p onclick="x()">Hi <a href="javascript:x()">link</a></p>', '<p>Hi <a>link</a></p>'),
+    ('<a href="https://example.com/?a=1&b=2">ok</a>',
+     '<a href="https://example.com/?a=1&amp;b=2" rel="nofollow noopener">ok</a>'),
+    ('<p>1 &lt; 2<br/>end', '<p>1 &lt; 2<br>end</p>'),
+])
+def test_sanitize_html(markup, expected):
+    assert sanitize_html(markup) == expected
+
+
+def test_plain_text_becomes_paragraphs():
+    assert render_content_html('One\nline\r\n\r\nTwo & three') == '<p>One<br>line</p>\n<p>Two &amp; three</p>'
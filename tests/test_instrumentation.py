@@ -0,0 +1,62 @@
+"""SQL instrumentation: fingerprints, the X-SQL-Queries header, N+1 flags and the panel."""
+import logging
+
+import pytest
+
+from app.instrumentation import RequestSQLStats, fingerprint
+from app.models import Post
+from tests.conftest import make_app
+
+
+def test_fingerprint_collapses_values():
+    assert fingerprint("SELECT *\n  FROM post WHERE id = 42 AND title = 'It''s'") == \
+        'SELECT * FROM post WHERE id = ? AND title = ?'
+    assert fingerprint('SELECT * FROM post WHERE id IN (?, ?, ?)') == \
+        fingerprint('SELECT * FROM post WHERE id IN (%(id_1)s, %(id_2)s)') == \
+        'SELECT * FROM post WHERE id IN (?, ...)'
+
+
+def test_stats_flag_repeated_lazy_loads():
+    stats = RequestSQLStats()
+    stats.queries = [('SELECT a', 1.0, False)] * 3 + [('SELECT b', 2.0, True)] * 4 + [('SELECT c', 1.0, True)]
+    assert stats.count == 8 and stats.total_ms == 12.0
+    assert stats.repeated(3) == [('SELECT b', 4), ('SELECT a', 3)]
+    assert stats.nplusone(3) == [('SELECT b', 4)]
+
+
+@pytest.fixture
+def instrumented(app):
+    # The seeded database, opened again with instrumentation on
+    path = app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+    app = make_app(path, SQL_INSTRUMENTATION=True, SQL_PANEL=True)
+
+    @app.route('/test/nplusone')
+    def comment_counts():
+        # One lazy load of post.comments per post: a textbook N+1
+        posts = Post.query.order_by(Post.id).limit(5).all()
+        return '<html><body>%s</body></html>' % sum(len(post.comments) for post in posts)
+    return app
+
+
+def test_header_reports_nplusone(instrumented, caplog):
+    with caplog.at_level(logging.WARNING, logger='app.instrumentation'):
+        response = instrumented.test_client().get('/test/nplusone')
+    count, time_ms, repeated, nplusone = response.headers['X-SQL-Queries'].split('; ')
+    assert count == '6'
+    assert time_ms.startswith('time=') and repeated == 'repeated=1' and nplusone == 'n+1=1'
+    assert 'lazy load ran 5 times' in caplog.text
+
+    html = response.get_data(as_text=True)
+    assert '<div id="sql-panel"' in html and html.index('sql-panel') < html.index('</body>')
+    assert '5×' in html and 'N+1 pattern' in html
+
+
+def test_clean_page_has_no_nplusone(instrumented):
+    response = instrumented.test_client().get('/')
+    assert response.headers['X-SQL-Queries'].endswith('n+1=0')
+
+
+def test_off_by_default(client):
+    response = client.get('/')
+    assert 'X-SQL-Queries' not in response.headers
+    assert 'sql-panel' not in response.get_data(as_text=True)
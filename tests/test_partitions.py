@@ -0,0 +1,119 @@
+"""Notification retention and the partition naming helpers (no PostgreSQL needed)."""
+from datetime import datetime, timedelta
+
+from app import db, partitions
+from app.models import Notification
+
+NOW = datetime(2026, 1, 15, 12, 30)
+
+
+def test_month_arithmetic():
+    assert partitions.month_start(NOW) == datetime(2026, 1, 1)
+    assert partitions.add_months(datetime(2026, 1, 1), -1) == datetime(2025, 12, 1)
+    assert partitions.add_months(datetime(2025, 11, 1), 14) == datetime(2027, 1, 1)
+
+
+def test_partition_names_round_trip():
+    name = partitions.partition_name(datetime(2025, 3, 1))
+    assert name == 'notification_y2025m03'
+    assert partitions.PARTITION_NAME.match(name).groups() == ('2025', '03')
+    assert partitions.PARTITION_NAME.match(partitions.DEFAULT_PARTITION) is None
+
+
+def test_retention_cutoff_keeps_whole_months():
+    assert partitions.retention_cutoff(1, NOW) == datetime(2026, 1, 1)
+    assert partitions.retention_cutoff(3, NOW) == datetime(2025, 11, 1)
+
+
+def test_drop_expired_deletes_old_rows_in_batches(app):
+    cutoff = partitions.retention_cutoff(2)
+    with app.app_context():
+        total = Notification.query.count()
+        for created_at in (cutoff - timedelta(days=400), cutoff - timedelta(days=1), cutoff + timedelta(hours=1)):
+            db.session.add(Notification(user_id=1, sender_id=2, type_code=3, created_at=created_at))
+        db.session.commit()
+        with db.engines['activity'].connect() as conn:
+            assert partitions.drop_expired(conn, keep_months=2, batch_size=1) == ([], 2)
+        assert Notification.query.count() == total + 1
+
+
+def test_prune_command_honours_keep_months_zero(app):
+    with app.app_context():
+        db.session.add(Notification(user_id=1, sender_id=2, type_code=3, created_at=datetime(2001, 1, 1)))
+        db.session.commit()
+        total = Notification.query.count()
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['notifications', 'prune', '--keep-months', '0'])
+    assert result.exit_code == 0 and 'nothing to prune' in result.output
+    result = runner.invoke(args=['notifications', 'prune'])
+    assert result.exit_code != 0 and 'NOTIFICATION_RETENTION_MONTHS' in result.output
+    result = runner.invoke(args=['notifications', 'prune', '--keep-months', '12'])
+    assert result.exit_code == 0 and 'Deleted 1 notification(s).' in result.output
+    with app.app_context():
+        assert Notification.query.count() == total - 1
+
+
+class RecordingConnection:
+    """Stands in for a PostgreSQL connection: logs SQL, answers from `results`."""
+
+    def __init__(self, results):
+        self.results = results  # (SQL prefix, rows) pairs, each used once
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.statements.append(sql)
+        for i, (prefix, rows) in enumerate(self.results):
+            if sql.startswith(prefix):
+                del self.results[i]
+                return FakeResult(rows)
+        return FakeResult([])
+
+    def commit(self):
+        pass
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+def test_new_partition_takes_its_rows_from_default(monkeypatch):
+    monkeypatch.setattr(partitions, 'list_partitions', lambda conn: {datetime(2026, 1, 1): 'notification_y2026m01'})
+    conn = RecordingConnection([('SELECT 1 FROM notification_default', [1])])
+    created = partitions.create_partitions(conn, datetime(2026, 1, 1), datetime(2026, 3, 1))
+    assert created == ['notification_y2026m02', 'notification_y2026m03']
+    february = [sql for sql in conn.statements if 'notification_y2026m02' in sql or 'DELETE' in sql]
+    expected = [
+        'CREATE TABLE notification_y2026m02 (LIKE notification',
+        'INSERT INTO notification_y2026m02 SELECT * FROM notification_default',
+        'DELETE FROM notification_default WHERE created_at >= :start',
+        "ALTER TABLE notification ATTACH PARTITION notification_y2026m02 FOR VALUES FROM ('2026-02-01",
+    ]
+    assert len(february) == len(expected)
+    assert all(sql.startswith(prefix) for sql, prefix in zip(february, expected))
+    # March had nothing in DEFAULT
+    assert conn.statements[-1].startswith('CREATE TABLE IF NOT EXISTS notification_y2026m03 PARTITION OF notification')
+
+
+def test_retention_also_prunes_the_default_partition(monkeypatch):
+    monkeypatch.setattr(partitions, 'is_partitioned', lambda conn: True)
+    monkeypatch.setattr(partitions, 'list_partitions', lambda conn: {
+        datetime(2025, 10, 1): 'notification_y2025m10', datetime(2026, 1, 1): 'notification_y2026m01'})
+    conn = RecordingConnection([('SELECT id FROM notification_default', [7, 9]),
+                                ('SELECT id FROM notification_default', [12])])
+    dropped, deleted = partitions.drop_expired(conn, keep_months=2, now=NOW, batch_size=2)
+    assert (dropped, deleted) == (['notification_y2025m10'], 3)
+    assert 'DELETE FROM notification_default WHERE id IN (7,9)' in conn.statements
+    assert 'DELETE FROM notification_default WHERE id IN (12)' in conn.statements
+    assert all('LIMIT :limit' in sql for sql in conn.statements if sql.startswith('SELECT id'))
@@ -0,0 +1,53 @@
+"""Password hashing service and rehash-on-login."""
+import pytest
+
+from app import db
+from app.models import User
+from app.passwords import PasswordHasher, PasswordServiceBusy, calibrate, hash_cost
+from tests.conftest import PASSWORD, login
+
+
+def test_hash_cost():
+    assert hash_cost('$2b$12$' + 'x' * 53) == 12
+    assert hash_cost('not a hash') is None
+
+
+def test_calibrate_stays_in_bounds():
+    assert 4 <= calibrate(1) <= 16
+    assert calibrate(1, minimum=6) >= 6
+
+
+def test_login_rehashes_to_target_cost(app, client):
+    with app.app_context():
+        assert hash_cost(db.session.get(User, 2).password_hash) == 4
+    app.extensions['passwords'].log_rounds = 5
+
+    login(client, 'bob')
+
+    with app.app_context():
+        assert hash_cost(db.session.get(User, 2).password_hash) == 5
+
+
+def test_busy_service_rejects_login(app, client):
+    hasher = PasswordHasher(4, max_concurrency=1, queue_timeout=0.01)
+    for _ in range(2):
+        hasher._slots.acquire()
+    app.extensions['passwords'] = hasher
+    with pytest.raises(PasswordServiceBusy):
+        hasher.hash('secret')
+    response = client.post('/login', data={'username': 'bob', 'password': 'password'})
+    assert response.status_code == 503
+
+
+def test_busy_service_skips_rehash_but_logs_in(app, client, monkeypatch):
+    hasher = app.extensions['passwords']
+    hasher.log_rounds = 5
+
+    def busy(password):
+        raise PasswordServiceBusy('Too many password checks in progress')
+    monkeypatch.setattr(hasher, 'hash', busy)
+
+    response = client.post('/login', data={'username': 'bob', 'password': PASSWORD})
+    assert response.status_code == 302
+    with app.app_context():
+        assert hash_cost(db.session.get(User, 2).password_hash) == 4
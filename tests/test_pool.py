@@ -0,0 +1,71 @@
+"""Pool options from the environment and checkout wait timing."""
+import sqlite3
+import threading
+import time
+
+import pytest
+from flask import Flask, g
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+from app import configure_engine_options
+from app.config import engine_options_from_env
+from app.pool import TimedQueuePool
+
+
+def test_engine_options_from_env():
+    options = engine_options_from_env({
+        'DB_POOL_SIZE': '8', 'DB_MAX_OVERFLOW': '2', 'DB_POOL_TIMEOUT': '2.5',
+        'DB_POOL_PRE_PING': 'no', 'DB_STATEMENT_TIMEOUT_MS': '5000',
+    })
+    assert (options['pool_size'], options['max_overflow'], options['pool_timeout']) == (8, 2, 2.5)
+    assert options['pool_recycle'] == 1800 and options['pool_pre_ping'] is False
+    assert options['connect_args']['options'] == '-c statement_timeout=5000'
+    assert engine_options_from_env({})['pool_pre_ping'] is True
+
+
+def test_server_binds_get_the_timed_pool():
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI='postgresql://db/main',
+        SQLALCHEMY_ENGINE_OPTIONS={'pool_size': 3},
+        SQLALCHEMY_BINDS={'activity': 'postgresql://db/activity', 'local': 'sqlite:///local.db'},
+    )
+    configure_engine_options(app)
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS'] == {'pool_size': 3, 'poolclass': TimedQueuePool}
+    assert app.config['SQLALCHEMY_BINDS']['activity'] == {
+        'pool_size': 3, 'poolclass': TimedQueuePool, 'url': 'postgresql://db/activity'}
+    assert app.config['SQLALCHEMY_BINDS']['local'] == 'sqlite:///local.db'
+
+
+def make_pool(connect_delay=0.0, **kwargs):
+    def creator():
+        time.sleep(connect_delay)
+        return sqlite3.connect(':memory:', check_same_thread=False)
+    return TimedQueuePool(creator, **kwargs)
+
+
+def test_opening_a_connection_is_not_counted_as_waiting():
+    pool = make_pool(connect_delay=0.2, pool_size=1, max_overflow=0)
+    pool.connect().close()
+    stats = pool.stats.as_dict()
+    assert stats['checkouts'] == 1 and stats['max_wait_ms'] < 100
+
+
+def test_waiting_for_a_free_connection_is_timed():
+    pool = make_pool(pool_size=1, max_overflow=0, timeout=5)
+    held = pool.connect()
+    threading.Timer(0.2, held.close).start()
+    app = Flask(__name__)
+    with app.test_request_context():
+        pool.connect().close()
+        assert g.pool_wait_ms >= 150
+    assert pool.stats.max_wait_ms >= 150
+
+
+def test_timeouts_are_counted():
+    pool = make_pool(pool_size=1, max_overflow=0, timeout=0.05)
+    held = pool.connect()
+    with pytest.raises(PoolTimeout):
+        pool.connect()
+    held.close()
+    assert pool.stats.timeouts == 1
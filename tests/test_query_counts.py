@@ -0,0 +1,93 @@
+"""Query-count regression tests.
+
+Every route in app/routes.py is requested against the seeded database, as
+an anonymous visitor and/or a logged-in user. It must run exactly the number
+of SQL statements listed below and fetch at most the listed rows. A change
+that adds a query per item on a page, or fetches whole tables, fails here.
+So does a change that saves queries, which keeps the table free of slack:
+lower the number in the same commit. If a change legitimately needs more,
+raise the number in the same commit and say why.
+"""
+import pytest
+
+from tests.conftest import login
+
+ALICE_POST = 1  # alice's busy post: 24 comments, 11 likes
+BOB_POST = 2
+
+# (user, method, url, data, statements, max rows)
+ROUTES = [
+    (None, 'get', '/', None, 2, 7),
+    (None, 'get', '/home?page=3', None, 2, 7),
+    (None, 'get', '/posts', None, 2, 7),
+    (None, 'get', '/posts?page=4', None, 2, 7),
+    (None, 'get', '/profile/alice', None, 5, 10),
+    (None, 'get', '/profile/alice/followers', None, 3, 14),
+    (None, 'get', '/profile/alice/following', None, 3, 14),
+    (None, 'get', '/post/%d' % ALICE_POST, None, 3, 26),
+    (None, 'get', '/register', None, 0, 0),
+    (None, 'post', '/register', {'username': 'newcomer', 'password': 'pw'}, 2, 1),
+    # The username filter is built at startup: a free name costs no query
+    (None, 'get', '/api/username-available?username=newcomer', None, 0, 0),
+    (None, 'get', '/api/username-available?username=alice', None, 1, 1),
+    (None, 'get', '/login', None, 0, 0),
+    (None, 'post', '/login', {'username': 'alice', 'password': 'password'}, 1, 2),
+    (None, 'get', '/dashboard', None, 0, 0),
+    ('bob', 'get', '/', None, 5, 8),
+    ('bob', 'get', '/posts', None, 5, 8),
+    ('bob', 'get', '/profile/alice', None, 8, 12),
+    ('bob', 'get', '/profile/alice/followers', None, 5, 14),
+    ('bob', 'get', '/profile/alice/following', None, 5, 14),
+    ('bob', 'get', '/post/%d' % ALICE_POST, None, 5, 27),
+    ('bob', 'get', '/feed', None, 4, 8),
+    ('bob', 'get', '/dashboard', None, 4, 8),
+    ('bob', 'get', '/profile/edit', None, 2, 2),
+    ('bob', 'post', '/profile/edit', {'bio': 'Updated bio'}, 3, 2),
+    ('bob', 'get', '/post/new', None, 2, 2),
+    ('bob', 'post', '/post/new', {'title': 'New', 'content': 'Text', 'category': 'Fiction'}, 7, 5),
+    ('bob', 'get', '/post/%d/edit' % BOB_POST, None, 3, 3),
+    ('bob', 'post', '/post/%d/edit' % BOB_POST, {'title': 'Edited', 'content': 'Edited'}, 4, 3),
+    ('bob', 'post', '/post/%d/delete' % BOB_POST, None, 4, 2),
+    ('bob', 'post', '/post/%d' % ALICE_POST, {'comment_content': 'Nice'}, 9, 6),
+    ('carol', 'post', '/post/%d/like' % BOB_POST, None, 3, 3),
+    ('bob', 'post', '/unfollow/alice', None, 5, 4),
+    ('bob', 'post', '/follow/carol', None, 7, 4),
+    ('bob', 'get', '/logout', None, 1, 1),
+    ('alice', 'get', '/notifications', None, 6, 24),
+    ('alice', 'post', '/notifications/mark-read', None, 2, 1),
+    ('alice', 'post', '/notifications/mark-one-read/1', None, 6, 5),
+    ('alice', 'post', '/notifications/delete/2', None, 3, 2),
+    ('alice', 'post', '/notifications/clear-all', None, 2, 1),
+    ('alice', 'get', '/ai-assistant', None, 2, 2),
+    ('alice', 'post', '/api/ai/continue-story', {'content': 'Once'}, 1, 1),
+    ('alice', 'post', '/api/ai/generate-starter', {'genre': 'mystery'}, 1, 1),
+    ('alice', 'post', '/api/ai/suggest-titles', {'content': 'Once'}, 1, 1),
+    ('alice', 'post', '/api/ai/improve-writing', {'text': 'Once'}, 1, 1),
+    ('alice', 'post', '/api/ai/get-suggestions', {'content': 'Once'}, 1, 1),
+]
+
+
+def route_id(case):
+    user, method, url = case[:3]
+    return '%s %s as %s' % (method.upper(), url, user or 'anonymous')
+
+
+@pytest.mark.parametrize('user, method, url, data, expected_statements, max_rows', ROUTES,
+                         ids=[route_id(case) for case in ROUTES])
+def test_route_query_counts(client, sql, user, method, url, data, expected_statements, max_rows):
+    if user:
+        login(client, user)
+    kwargs = {}
+    if data is not None:
+        kwargs['json' if url.startswith('/api/') else 'data'] = data
+
+    with sql.count():
+        response = getattr(client, method)(url, **kwargs)
+
+    assert response.status_code < 500
+    report = '\n'.join(sql.statements)
+    assert len(sql.statements) <= expected_statements, \
+        '%s ran %d statements (max %d):\n%s' % (url, len(sql.statements), expected_statements, report)
+    assert len(sql.statements) == expected_statements, \
+        '%s now runs %d statements; lower its budget from %d' % (url, len(sql.statements), expected_statements)
+    assert sql.rows <= max_rows, '%s fetched %d rows (max %d)' % (url, sql.rows, max_rows)
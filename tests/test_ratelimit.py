@@ -0,0 +1,62 @@
+"""Token-bucket rate limiting."""
+from app.ratelimit import MemoryBuckets, parse_rate
+from tests.conftest import login
+
+
+def test_parse_rate():
+    assert parse_rate('10/minute') == (10, 10 / 60)
+    assert parse_rate('5/hours') == (5, 5 / 3600)
+
+
+def test_bucket_allows_burst_then_refills(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('app.ratelimit.time.monotonic', lambda: now[0])
+    buckets = MemoryBuckets()
+    assert all(buckets.take('k', 3, 1.0)[0] for _ in range(3))
+    allowed, retry_after = buckets.take('k', 3, 1.0)
+    assert not allowed and retry_after == 1.0
+    now[0] += 1
+    assert buckets.take('k', 3, 1.0)[0]
+
+
+def test_login_burst_gets_cheap_429(app, client, sql):
+    app.config['RATELIMITS'] = {'login': {'ip': '3/minute'}}
+    for _ in range(3):
+        client.post('/login', data={'username': 'bob', 'password': 'wrong'})
+    with sql.count():
+        response = client.post('/login', data={'username': 'bob', 'password': 'password'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '20'
+    assert sql.statements == []
+
+
+def test_api_limit_is_per_user_and_json(app, client):
+    app.config['RATELIMITS'] = {'ai': {'ip': None, 'user': '1/minute'}}
+    login(client, 'bob')
+    assert client.post('/api/ai/improve-writing', json={'text': 'x'}).status_code == 200
+    response = client.post('/api/ai/improve-writing', json={'text': 'x'})
+    assert response.status_code == 429
+    assert response.get_json()['success'] is False
+
+    other = app.test_client()
+    login(other, 'carol')
+    assert other.post('/api/ai/improve-writing', json={'text': 'x'}).status_code == 200
+
+
+def test_trusted_proxy_hop_gives_each_client_a_bucket(app, client):
+    app.config['RATELIMITS'] = {'login': {'ip': '1/minute'}}
+    app.config['RATELIMIT_TRUSTED_PROXIES'] = 1
+
+    def attempt(address):
+        return client.post('/login', data={'username': 'bob', 'password': 'wrong'},
+                           headers={'X-Forwarded-For': 'spoofed, %s' % address}).status_code
+    assert attempt('203.0.113.1') == 200
+    assert attempt('203.0.113.1') == 429
+    assert attempt('203.0.113.2') == 200
+
+
+def test_untrusted_proxy_skips_ip_buckets(app, client):
+    app.config['RATELIMITS'] = {'login': {'ip': '1/minute'}}
+    app.config['RATELIMIT_BEHIND_PROXY'] = True
+    for _ in range(3):
+        assert client.post('/login', data={'username': 'bob', 'password': 'wrong'}).status_code == 200
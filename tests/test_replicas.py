@@ -0,0 +1,94 @@
+"""Read-replica routing, using two SQLite files as primary and replica."""
+import shutil
+import sqlite3
+import threading
+
+import pytest
+
+from app import db
+from app.models import Comment
+from tests.conftest import login, make_app
+
+PRIMARY_TITLE = 'alice story 0'
+REPLICA_TITLE = 'Replica copy of the story'
+
+
+@pytest.fixture
+def primary(seeded_db, tmp_path):
+    path = str(tmp_path / 'primary.db')
+    shutil.copyfile(seeded_db, path)
+    return path
+
+
+@pytest.fixture
+def replica(seeded_db, tmp_path):
+    # Same data, except a title that tells us which database answered
+    path = str(tmp_path / 'replica.db')
+    shutil.copyfile(seeded_db, path)
+    connection = sqlite3.connect(path)
+    connection.execute('UPDATE post SET title = ? WHERE id = 1', (REPLICA_TITLE,))
+    connection.commit()
+    connection.close()
+    return path
+
+
+def replica_app(primary, replica_url, **config):
+    app = make_app(primary, DATABASE_REPLICA_URLS=[replica_url], **config)
+    # Let the startup health probe finish before the first request
+    with app.app_context():
+        app.extensions['replicas'].check_all(db.engines, wait=True)
+    return app
+
+
+def title_shown(client):
+    html = client.get('/post/1').get_data(as_text=True)
+    assert PRIMARY_TITLE in html or REPLICA_TITLE in html
+    return REPLICA_TITLE if REPLICA_TITLE in html else PRIMARY_TITLE
+
+
+def test_reads_go_to_replica(primary, replica):
+    client = replica_app(primary, 'sqlite:///' + replica).test_client()
+    assert title_shown(client) == REPLICA_TITLE
+
+
+def test_writes_go_to_primary_and_are_read_back(primary, replica):
+    app = replica_app(primary, 'sqlite:///' + replica)
+    client = app.test_client()
+    login(client, 'bob')
+    client.post('/post/1', data={'comment_content': 'Written to the primary'})
+    # Within the read-your-writes window the primary answers
+    assert title_shown(client) == PRIMARY_TITLE
+    with app.app_context():
+        assert Comment.query.filter_by(content='Written to the primary').count() == 1
+
+
+def test_window_expires(primary, replica):
+    client = replica_app(primary, 'sqlite:///' + replica, REPLICA_READ_YOUR_WRITES=0).test_client()
+    login(client, 'bob')
+    assert title_shown(client) == REPLICA_TITLE
+
+
+def test_unavailable_replica_falls_back_to_primary(primary, tmp_path):
+    client = replica_app(primary, 'sqlite:///' + str(tmp_path / 'missing' / 'replica.db')).test_client()
+    assert title_shown(client) == PRIMARY_TITLE
+    assert client.get('/').status_code == 200
+
+
+def test_health_checks_never_run_in_a_request(primary, replica, monkeypatch):
+    app = replica_app(primary, 'sqlite:///' + replica, REPLICA_HEALTH_INTERVAL=0)
+    probed_in = []
+    monkeypatch.setattr('app.replicas.probe', lambda engine: probed_in.append(threading.current_thread()) or True)
+    client = app.test_client()
+    assert title_shown(client) == REPLICA_TITLE
+    with app.app_context():
+        app.extensions['replicas'].check_all(db.engines, wait=True)
+    assert probed_in and threading.current_thread() not in probed_in
+
+
+def test_unknown_replica_is_not_used_until_probed(primary, replica, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr('app.replicas.probe', lambda engine: release.wait(5))
+    app = make_app(primary, DATABASE_REPLICA_URLS=['sqlite:///' + replica])
+    # The probe is still running: the request is served by the primary at once
+    assert title_shown(app.test_client()) == PRIMARY_TITLE
+    release.set()
@@ -0,0 +1,89 @@
+"""Soft delete hides content at once; the chunked purge removes it later."""
+from sqlalchemy import func, select
+
+from app import db
+from app.models import Comment, Like, Notification, Post, User, followers
+from app.purge import purge_deleted
+from tests.conftest import login
+
+
+def test_deleted_post_is_hidden_then_purged(app, client):
+    login(client, 'alice')
+    assert client.post('/post/1/delete').status_code == 302
+    assert client.get('/post/1').status_code == 404
+
+    with app.app_context():
+        assert db.session.get(Post, 1) is None
+        assert Post.query.filter_by(id=1).execution_options(include_deleted=True).one().deleted_at
+        assert Comment.query.filter_by(post_id=1).count() == 24
+
+        deleted = purge_deleted(batch_size=5, pause=0)
+        assert deleted['comment'] == 24 and deleted['like'] == 11 and deleted['post'] == 1
+        assert Comment.query.filter_by(post_id=1).count() == 0
+        assert Like.query.filter_by(post_id=1).count() == 0
+        assert Notification.query.filter_by(target_id=1).count() == 0
+
+
+def test_deleted_user_disappears_with_their_content(app, client):
+    with app.app_context():
+        posts_before = db.session.execute(select(func.count()).select_from(Post)).scalar()
+        bob = User.by_username('bob').one()
+        bob.soft_delete()
+        db.session.commit()
+
+        assert User.by_username('bob').first() is None
+        assert db.session.execute(select(func.count()).select_from(Post)).scalar() == posts_before - 6
+        assert all(c.user_id != 2 for c in db.session.get(Post, 1).comments)
+
+    assert client.get('/profile/bob').status_code == 404
+    # The name stays taken until the account is purged
+    assert client.get('/api/username-available?username=Bob').get_json()['available'] is False
+
+
+def test_purging_a_user_recounts_likes(app):
+    with app.app_context():
+        User.by_username('bob').one().soft_delete()
+        db.session.commit()
+        likes_before = db.session.get(Post, 1).likes
+
+        purge_deleted(batch_size=3, pause=0)
+        db.session.expire_all()
+        assert db.session.get(Post, 1).likes == likes_before - 1
+        assert Like.query.filter_by(user_id=2).count() == 0
+        assert Comment.query.filter_by(user_id=2).count() == 0
+        assert Notification.query.filter((Notification.user_id == 2) | (Notification.sender_id == 2)).count() == 0
+        assert db.session.execute(select(func.count()).select_from(followers).where(
+            (followers.c.follower_id == 2) | (followers.c.followed_id == 2))).scalar() == 0
+        assert User.query.execution_options(include_deleted=True).filter_by(id=2).first() is None
+
+
+def test_notifications_never_point_at_hidden_posts(app, client):
+    with app.app_context():
+        bob = User.by_username('bob').one()
+        Notification.create_notification(1, bob.id, 'new_post', target_id=bob.posts[0].id)
+        bob.soft_delete()
+        db.session.commit()
+
+    login(client, 'alice')
+    assert client.post('/post/1/delete').status_code == 302
+    with app.app_context():
+        alice = db.session.get(User, 1)
+        assert alice.unread_notifications_count() == 1
+        assert Notification.query.filter_by(target_id=1).count() == 0
+
+    page = client.get('/notifications').get_data(as_text=True)
+    assert 'None' not in page
+    assert 'Someone published a story that has since been deleted' in page
+
+
+def test_follow_notification_from_deleted_user_has_no_link(app, client):
+    with app.app_context():
+        notification = Notification.create_notification(1, 3, 'follow')
+        db.session.get(User, 3).soft_delete()
+        db.session.commit()
+        notification_id = notification.id
+
+    login(client, 'alice')
+    assert 'Someone started following you' in client.get('/notifications').get_data(as_text=True)
+    response = client.post('/notifications/mark-one-read/%d' % notification_id)
+    assert response.status_code == 302 and response.headers['Location'].endswith('/notifications')
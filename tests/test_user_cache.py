@@ -0,0 +1,35 @@
+"""The cached Flask-Login user loader."""
+from tests.conftest import login
+
+
+def user_queries(sql):
+    return [s for s in sql.statements if s.lstrip().startswith('SELECT user.')]
+
+
+def test_repeat_requests_skip_user_query(client, sql):
+    login(client, 'bob')
+    with sql.count():
+        client.get('/dashboard')
+    first = len(sql.statements)
+    with sql.count():
+        client.get('/dashboard')
+    assert len(sql.statements) == first - 1
+    assert not user_queries(sql)
+
+
+def test_edit_profile_invalidates(client):
+    login(client, 'bob')
+    client.get('/profile/edit')
+    client.post('/profile/edit', data={'bio': 'Fresh bio'})
+    assert 'Fresh bio' in client.get('/profile/edit').get_data(as_text=True)
+
+
+def test_cached_user_loads_other_attributes(app, client):
+    login(client, 'bob')
+    client.get('/dashboard')
+    from app.user_cache import load_user
+    with app.test_request_context():
+        user = load_user(2)
+        assert user.username == 'bob'
+        assert user.check_password('password')
+        assert user.is_following(load_user(1))
@@ -0,0 +1,43 @@
+"""Bloom-filter backed /api/username-available."""
+from app.username_filter import BloomFilter
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    names = ['user%d' % i for i in range(1000)]
+    for name in names:
+        bloom.add(name)
+    assert all(name in bloom for name in names)
+    false_positives = sum('other%d' % i in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+def test_available_name_needs_no_query(client, sql):
+    with sql.count():
+        response = client.get('/api/username-available?username=Newcomer')
+    assert response.get_json()['available'] is True
+    assert sql.statements == []
+
+
+def test_taken_name_any_case(client):
+    assert client.get('/api/username-available?username=ALICE').get_json()['available'] is False
+
+
+def test_registered_name_is_added(client):
+    client.post('/register', data={'username': 'Zed', 'password': 'pw'})
+    assert client.get('/api/username-available?username=zed').get_json()['available'] is False
+
+
+def test_missing_username(client):
+    assert client.get('/api/username-available').status_code == 400
+
+
+def test_stale_filter_is_rebuilt_in_the_background(app, client):
+    username_filter = app.extensions['username_filter']
+    old = username_filter._bloom
+    username_filter.refresh = 0
+    with app.app_context():
+        # Answered from the old filter while the new one is built
+        assert username_filter.might_exist('newcomer') is False
+    username_filter.rebuild(wait=True)
+    assert username_filter._bloom is not old and 'alice' in username_filter._bloom
@@ -0,0 +1,23 @@
+"""Case-insensitive usernames through the indexed username_lower column."""
+from app import db
+from app.models import User
+from tests.conftest import login
+
+
+def test_lookups_ignore_case(client):
+    assert client.get('/profile/ALICE').status_code == 200
+    login(client, 'BoB')
+
+
+def test_register_rejects_other_case(app, client):
+    client.post('/register', data={'username': 'Alice', 'password': 'pw'})
+    with app.app_context():
+        assert User.query.filter_by(username_lower='alice').count() == 1
+
+
+def test_username_lower_follows_username(app):
+    with app.app_context():
+        user = db.session.get(User, 2)
+        user.username = 'Robert'
+        db.session.commit()
+        assert User.by_username('ROBERT').one().username_lower == 'robert'